@@ -0,0 +1,74 @@
+"""数组文件 - .npy 与 raw (无文件头的像素数据) 的内存映射读写
+
+地形工具导出的高度图可以直接处理, 不需要先转换为PNG:
+
+    heights = open_array("terrain.r16")                       # 正方形时自动推断边长
+    heights = open_array("terrain.raw", (2049, 4097), "<u2")
+    apply_uniform_blur("terrain.npy", "output/terrain_blur.npy", radius=4)
+
+读取时不解码、不整幅载入内存, 只有访问到的分块经过系统页缓存;
+输出为 .npy / raw 时逐块写入内存映射文件。
+"""
+import math
+import os
+
+import numpy as np
+
+# raw 扩展名 -> 默认数据类型 (小端)
+RAW_DTYPES = {".raw": "<u2", ".r16": "<u2", ".r8": "u1", ".r32": "<f4"}
+
+
+def _extension(path):
+    return os.path.splitext(os.fspath(path))[1].lower()
+
+
+def is_array_path(path):
+    """是否为 .npy 或 raw 数组文件"""
+    extension = _extension(path)
+    return extension == ".npy" or extension in RAW_DTYPES
+
+
+def open_array(path, shape=None, dtype=None):
+    """以只读内存映射打开 .npy 或 raw 文件
+
+    raw 文件没有文件头, 需要给出 shape (高, 宽[, 通道]) 与 dtype;
+    未给出 shape 时按正方形单通道推断, 文件大小不符时报错。
+    """
+    if _extension(path) == ".npy":
+        return np.load(path, mmap_mode="r")
+    dtype = np.dtype(dtype or RAW_DTYPES.get(_extension(path), "<u2"))
+    if shape is None:
+        count = os.path.getsize(path) // dtype.itemsize
+        side = math.isqrt(count)
+        if side * side * dtype.itemsize != os.path.getsize(path):
+            raise ValueError(f"无法推断raw文件的尺寸, 请指定形状: {path}")
+        shape = (side, side)
+    return np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
+
+
+def check_raw_output(path, shape, dtype):
+    """raw 输出没有文件头, 只能保存与扩展名相符的单通道数据, 否则读回时格式不对
+
+    如法向贴图 (RGB uint8) 写入 .r16 会被当作16位单通道读回, 此时抛出 ValueError。
+    """
+    extension = _extension(path)
+    if extension not in RAW_DTYPES:
+        return
+    expected = np.dtype(RAW_DTYPES[extension])
+    if np.dtype(dtype) != expected or len(shape) > 2:
+        raise ValueError(f"{extension} 文件只能保存 {expected.str} 单通道数据, 结果为 "
+                         f"{np.dtype(dtype).str} {shape[2] if len(shape) > 2 else 1}通道, 请改用 .npy 或图像格式")
+
+
+def create_array(path, shape, dtype):
+    """创建可写的内存映射输出: .npy 带文件头, 其它扩展名为 raw (见 check_raw_output)"""
+    if _extension(path) == ".npy":
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    check_raw_output(path, shape, dtype)
+    return np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+
+
+def array_size(path, shape=None, dtype=None):
+    """数组文件的 (宽, 高), 不读取像素"""
+    array = open_array(path, shape, dtype)
+    return array.shape[1], array.shape[0]
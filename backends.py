@@ -0,0 +1,107 @@
+"""计算后端 - 同一组计算内核的不同实现, 按名称选择
+
+    backend = get_backend()            # 参数 > 环境变量 IMGPROC_BACKEND > auto
+    blurred = backend.uniform_blur(pixels, 5)
+
+numpy 为纯NumPy实现 (engine), 总是可用; numba 为JIT编译的并行内核 (numba_kernels),
+只在安装了 numba 时可用。auto (默认) 在安装了 numba 时选 numba, 否则选 numpy。
+numba 后端的内核在第一次调用时才导入 numba (约0.5秒), 只用到 numpy 实现的操作
+(法向贴图、高斯模糊) 不受影响; 编译结果缓存在磁盘上, 之后启动不再重新编译。
+各后端的结果与 numpy 逐位相同, 后端没有实现的内核直接使用 numpy 的实现。
+"""
+import importlib.util
+import os
+import sys
+from collections import namedtuple
+
+from engine import compute_normal_map, compute_uniform_blur, gaussian_blur_padded, radial_blur_window
+
+# 选择后端的环境变量
+BACKEND_ENV = "IMGPROC_BACKEND"
+DEFAULT_BACKEND = "auto"
+
+# 计算内核, 参数与 engine 中的同名函数相同:
+# normal_map(pixels, strength, kernel)            -> compute_normal_map
+# uniform_blur(pixels, radius)                    -> compute_uniform_blur
+# gaussian_blur_padded(padded, sigma, dtype)      -> gaussian_blur_padded
+# radial_blur_window(read, width, height, cx, cy, strength, window) -> radial_blur_window
+Backend = namedtuple("Backend", ["name", "normal_map", "uniform_blur", "gaussian_blur_padded",
+                                 "radial_blur_window"])
+
+
+def _numpy_backend():
+    return Backend("numpy", compute_normal_map, compute_uniform_blur, gaussian_blur_padded,
+                   radial_blur_window)
+
+
+def _numba_kernel(name):
+    """numba_kernels 中的内核, 第一次调用时才导入 (导入 numba 与加载编译缓存)"""
+    def kernel(*args):
+        import numba_kernels
+        return getattr(numba_kernels, name)(*args)
+    kernel.__name__ = name
+    return kernel
+
+
+def _numba_backend():
+    return Backend("numba", compute_normal_map, _numba_kernel("uniform_blur"), gaussian_blur_padded,
+                   _numba_kernel("radial_blur_window"))
+
+
+# 后端名称 -> (是否可用, 创建函数); 创建函数只在第一次用到时调用
+_FACTORIES = {
+    "numpy": (lambda: True, _numpy_backend),
+    "numba": (lambda: importlib.util.find_spec("numba") is not None, _numba_backend),
+}
+_backends = {}
+
+
+def register_backend(name, factory, available=None):
+    """注册一个后端: factory() 返回 Backend, available() 返回当前环境能否使用"""
+    _FACTORIES[name] = (available or (lambda: True), factory)
+    _backends.pop(name, None)
+
+
+def available_backends():
+    """当前环境中可用的后端名称"""
+    return [name for name, (available, _) in _FACTORIES.items() if available()]
+
+
+def backend_name(name=None):
+    """解析后端名称: 未指定时取环境变量, 都没有时为 auto; auto 时有 numba 就用 numba"""
+    name = name or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+    if name == "auto":
+        return "numba" if "numba" in available_backends() else "numpy"
+    if name not in _FACTORIES:
+        raise ValueError(f"未知的计算后端: {name} (可选 {', '.join(['auto'] + list(_FACTORIES))})")
+    if not _FACTORIES[name][0]():
+        raise ValueError(f"计算后端 {name} 不可用 (未安装依赖)")
+    return name
+
+
+def get_backend(name=None):
+    """按名称取得后端 (见 backend_name), 同一进程中只创建一次"""
+    name = backend_name(name)
+    if name not in _backends:
+        _backends[name] = _FACTORIES[name][1]()
+    return _backends[name]
+
+
+def select_backend(name):
+    """设为本进程及之后启动的子进程的默认后端 (写入环境变量), 返回解析后的名称
+
+    后端不可用时抛出 ValueError。
+    """
+    resolved = backend_name(name)
+    os.environ[BACKEND_ENV] = name
+    return resolved
+
+
+def limit_worker_threads():
+    """进程池工作进程的初始化函数: JIT内核在每个工作进程中只用一个线程
+
+    并行已由进程池负责, 各进程再各开满核数的线程只会互相争抢。
+    """
+    os.environ["NUMBA_NUM_THREADS"] = "1"
+    if "numba" in sys.modules:
+        sys.modules["numba"].set_num_threads(1)
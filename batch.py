@@ -0,0 +1,326 @@
+"""批处理命令行 - 无界面环境下批量处理图片
+
+用法:
+    python processing.py normal "textures/*.png" --out output
+    python processing.py blur "photos/*.jpg" --out output --radius 8 --workers 8
+    python processing.py gaussian "photos/*.jpg" --out output --sigma 20
+    python processing.py normal-mips "textures/*.png" --out output --packed   # 法向贴图整条mip链
+    python processing.py radial "shots/*.png" --out output --strength 0.03
+    python processing.py fbm "output/noise_*.png" --out output
+    python processing.py blur "terrain/*.r16" --out output --radius 4   # 16位raw高度图, 不解码
+    python processing.py normal "terrain/*.raw" --out output --raw-shape 2049x4097 --raw-dtype "<u2"
+
+不会导入pygame或tkinter。
+"""
+import argparse
+import collections
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+import instrument
+import processing
+from arrayio import RAW_DTYPES, array_size, is_array_path
+from backends import limit_worker_threads, select_backend
+from cache import ResultCache
+from engine import NORMAL_KERNELS
+from noise import NoisePool
+from writer import BackgroundWriter, make_encoder
+
+# 子命令 -> (处理函数名, 输出文件后缀)
+OPERATIONS = {
+    "normal": ("generate_normal_map", "normal"),
+    "normal-mips": ("bake_normal_mips", "normal"),
+    "blur": ("apply_uniform_blur", "blur"),
+    "gaussian": ("apply_gaussian_blur", "gaussian"),
+    "radial": ("apply_radial_blur", "radial"),
+}
+
+# 结果为RGB 8位的子命令: raw 只能保存单通道数据 (见 arrayio.check_raw_output), raw 输入默认输出PNG
+RGB_COMMANDS = ("normal", "normal-mips")
+
+
+def output_path_for(image_path, out_dir, suffix, extension=None, keep_extension=False,
+                    raw_extension=None):
+    """与界面相同的命名规则: <原文件名>_<后缀>.<扩展名>, 可指定其它扩展名
+
+    keep_extension 为真时文件名中保留原扩展名: <原文件名>_<原扩展名>_<后缀>.<扩展名>。
+    未指定 extension 时, raw 输入改用 raw_extension (如法向贴图不能保存为 raw)。
+    """
+    file_base, file_ext = os.path.splitext(os.path.basename(image_path))
+    if keep_extension and file_ext:
+        file_base = f"{file_base}_{file_ext[1:]}"
+    if extension:
+        file_ext = f".{extension}"
+    elif raw_extension and file_ext.lower() in RAW_DTYPES:
+        file_ext = f".{raw_extension}"
+    return os.path.join(out_dir, f"{file_base}_{suffix}{file_ext}")
+
+
+def output_paths(paths, out_dir, suffix, extension=None, raw_extension=None):
+    """所有输入的输出路径, 在提交任务之前检查重名
+
+    只有扩展名不同的输入 (如 t.npy 与 t.r16, 或指定 --format 时的 a.png 与 a.jpg)
+    在文件名中保留原扩展名; 仍然重名时 (如不同目录下的同名文件) 抛出 ValueError。
+    """
+    outputs = [output_path_for(path, out_dir, suffix, extension, raw_extension=raw_extension)
+               for path in paths]
+    counts = collections.Counter(os.path.normcase(output) for output in outputs)
+    outputs = [output_path_for(path, out_dir, suffix, extension,
+                               keep_extension=counts[os.path.normcase(output)] > 1,
+                               raw_extension=raw_extension)
+               for path, output in zip(paths, outputs)]
+    sources = {}
+    for path, output in zip(paths, outputs):
+        key = os.path.normcase(output)
+        if key in sources:
+            raise ValueError(f"输出文件重名: {sources[key]} 与 {path} 都会写入 {output}")
+        sources[key] = path
+    return outputs
+
+
+# 每个进程按目录复用一个缓存对象 (缓存含锁, 不能跨进程传递)
+_caches = {}
+
+
+def _cache_for(directory):
+    if directory not in _caches:
+        _caches[directory] = ResultCache(directory)
+    return _caches[directory]
+
+
+def run_job(command, image_path, output_path, options, writer=None):
+    """在工作进程中处理单个文件 (传入 writer 时结果交给后台写出)
+
+    返回 (输入, 输出, 是否成功, 耗时, 百万像素数, 是否命中缓存, 计时事件)
+    """
+    start = time.perf_counter()
+    try:
+        if is_array_path(image_path):
+            width, height = array_size(image_path, options.get("raw_shape"), options.get("raw_dtype"))
+        else:
+            with Image.open(image_path) as img:
+                width, height = img.size
+        megapixels = width * height / 1e6
+    except Exception:
+        megapixels = 0.0
+
+    options = dict(options)
+    cache_dir = options.pop("cache_dir", None)
+    trace = options.pop("trace", None)
+    cache = _cache_for(cache_dir) if cache_dir else None
+    misses = cache.misses if cache else 0
+    if cache:
+        options["cache"] = cache
+    if writer:
+        options["writer"] = writer
+
+    func = getattr(processing, OPERATIONS[command][0])
+    events = None
+    if trace is None:
+        success = func(image_path, output_path, **options)
+    else:
+        # 每个文件单独记录, 事件随结果返回主进程汇总
+        with instrument.recording(memory=trace == "memory") as recorder:
+            success = func(image_path, output_path, **options)
+        events = recorder.events
+    cached = bool(cache) and cache.misses == misses
+    return image_path, output_path, success, time.perf_counter() - start, megapixels, cached, events
+
+
+def parse_shape(text):
+    """raw 文件的形状: 高x宽 或 高x宽x通道 (也可以用逗号分隔)"""
+    try:
+        shape = tuple(int(part) for part in text.lower().replace(",", "x").split("x"))
+    except ValueError:
+        shape = ()
+    if len(shape) not in (2, 3) or min(shape) <= 0:
+        raise argparse.ArgumentTypeError(f"无效的形状: {text} (应为 高x宽 或 高x宽x通道)")
+    return shape
+
+
+def _options(args):
+    """从命令行参数整理出处理函数的关键字参数"""
+    options = {}
+    if args.command in ("normal", "normal-mips"):
+        options["strength"] = args.strength if args.strength is not None else 5.0
+        options["kernel"] = args.kernel
+        if args.command == "normal-mips":
+            options["levels"] = args.levels
+            options["packed"] = args.packed
+    elif args.command == "blur":
+        options["radius"] = args.radius
+    elif args.command == "gaussian":
+        options["sigma"] = args.sigma
+    elif args.command == "radial":
+        options["strength"] = args.strength if args.strength is not None else 0.02
+    if args.quality and args.command in ("blur", "gaussian"):
+        options["quality"] = args.quality
+    # mip链整幅计算, 不分块也不经过结果缓存
+    if args.tile_size and args.command != "normal-mips":
+        options["tile_size"] = args.tile_size
+    if args.max_memory and args.command != "normal-mips":
+        options["max_memory"] = args.max_memory * 1024 * 1024
+    if args.cache and args.command != "normal-mips":
+        options["cache_dir"] = args.cache
+    if args.raw_shape:
+        options["raw_shape"] = args.raw_shape
+    if args.raw_dtype:
+        options["raw_dtype"] = args.raw_dtype
+    if args.trace:
+        options["trace"] = "memory" if args.trace_memory else "time"
+    encoder = make_encoder(args.png_level, args.jpeg_quality)
+    if encoder:
+        options["encoder"] = encoder
+    return options
+
+
+def run_fbm(paths, out_dir):
+    """把匹配到的所有噪声图叠加为一张分形布朗运动图"""
+    start = time.perf_counter()
+    output_path = os.path.join(out_dir, "fbm.png")
+    # 逐个解码装入图层数组, 不会同时打开所有文件
+    pool = NoisePool(capacity=len(paths))
+    for path in paths:
+        with Image.open(path) as img:
+            pool.add(img)
+    success = processing.fractal_brownian_motion(pool.array, output_path)
+    status = "完成" if success else "失败"
+    print(f"[{status}] {len(paths)} 张噪声图 -> {output_path} ({time.perf_counter() - start:.2f}s)")
+    return 0 if success else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="processing.py", description="批量图像处理")
+    parser.add_argument("command", choices=sorted(OPERATIONS) + ["fbm"], help="处理类型")
+    parser.add_argument("pattern", help="输入文件的glob模式, 如 'images/*.png'")
+    parser.add_argument("--out", default="output", help="输出目录 (默认 output)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    parser.add_argument("--radius", type=int, default=5, help="均匀模糊半径")
+    parser.add_argument("--sigma", type=float, default=2.0, help="高斯模糊标准差 (像素)")
+    parser.add_argument("--quality", type=int, default=None,
+                        help="模糊的近似模式: 在缩小的层级上计算再放大, 粗层级上至少保留的半径像素数 (如8); "
+                             "主要用于大 sigma 的高斯模糊, 均匀模糊本身与半径无关, 近似只快约2.5倍")
+    parser.add_argument("--strength", type=float, default=None, help="法向贴图/径向模糊强度")
+    parser.add_argument("--kernel", choices=sorted(NORMAL_KERNELS), default="central", help="法向贴图梯度核")
+    parser.add_argument("--levels", type=int, default=None, help="normal-mips 生成的级数 (默认直到1x1)")
+    parser.add_argument("--packed", action="store_true",
+                        help="normal-mips 把整条链排在一个文件中 (默认每级一个 _mip<级数> 文件)")
+    parser.add_argument("--tile-size", type=int, default=None, help="分块边长 (启用分块处理)")
+    parser.add_argument("--max-memory", type=int, default=None, help="分块处理内存上限 (MB)")
+    parser.add_argument("--cache", default=None, help="结果缓存目录, 重复处理相同输入时直接复用")
+    parser.add_argument("--raw-shape", type=parse_shape, default=None,
+                        help="raw输入的形状 高x宽[x通道] (默认按正方形单通道推断)")
+    parser.add_argument("--raw-dtype", default=None,
+                        help="raw输入的数据类型, 如 '<u2'、u1、'<f4' (默认按扩展名: .raw/.r16 为16位, .r8 为8位)")
+    parser.add_argument("--format", choices=["png", "jpg", "tga", "npy", "r16"], default=None,
+                        help="输出格式 (默认与输入相同, raw 输入的法向贴图为png); tga 不压缩, "
+                             "npy/r16 原样保存数组, 适合中间结果")
+    parser.add_argument("--png-level", type=int, choices=range(10), default=None, metavar="0-9",
+                        help="PNG压缩级别, 越低编码越快、文件越大 (默认6)")
+    parser.add_argument("--jpeg-quality", type=int, default=None, help="JPEG质量 1-95 (默认75)")
+    parser.add_argument("--write-queue", type=int, default=4,
+                        help="单进程时后台写出队列长度, 编码与下一个文件的计算重叠; 0 表示同步写出")
+    parser.add_argument("--trace", default=None,
+                        help="记录各阶段耗时并写出 (.jsonl 为事件日志, 其它为 Chrome trace), 结束时打印汇总表")
+    parser.add_argument("--trace-memory", action="store_true", help="记录时同时统计峰值内存 (tracemalloc)")
+    parser.add_argument("--backend", choices=["auto", "numpy", "numba"], default=None,
+                        help="计算后端 (默认取环境变量 IMGPROC_BACKEND, 未设置时为 auto: 安装了numba时使用numba)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    paths = sorted(glob.glob(args.pattern, recursive=True))
+    if not paths:
+        print(f"没有匹配的文件: {args.pattern}")
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    if args.backend:
+        try:
+            select_backend(args.backend)
+        except ValueError as e:
+            print(e)
+            return 1
+
+    if args.command == "fbm":
+        return run_fbm(paths, args.out)
+
+    suffix = OPERATIONS[args.command][1]
+    raw_extension = None
+    if args.command in RGB_COMMANDS:
+        if args.format == "r16":
+            print("法向贴图为RGB 8位, 不能保存为 r16, 请使用 png 或 npy")
+            return 1
+        raw_extension = "png"
+    try:
+        outputs = output_paths(paths, args.out, suffix, args.format, raw_extension)
+    except ValueError as e:
+        print(e)
+        return 1
+    options = _options(args)
+    workers = max(1, min(args.workers, len(paths)))
+    failures = 0
+    cache_hits = 0
+    total_megapixels = 0.0
+    recorder = instrument.Recorder() if args.trace else None
+    start = time.perf_counter()
+
+    jobs = [(args.command, path, output_path, options)
+            for path, output_path in zip(paths, outputs)]
+    writer = None
+    if workers == 1:
+        # 单进程时直接在当前进程处理, 省去进程池启动开销; 结果在后台线程中写出
+        if args.write_queue > 0:
+            writer = BackgroundWriter(max_pending=args.write_queue)
+        if recorder:
+            # 整个运行共用一个记录器, 后台线程的写出也能记录下来
+            recorder = instrument.enable(memory=args.trace_memory)
+            jobs = [job[:3] + ({key: value for key, value in options.items() if key != "trace"},)
+                    for job in jobs]
+        results = (run_job(*job, writer) for job in jobs)
+    else:
+        # 文件分发到进程池, 按完成顺序报告每个文件的状态
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=limit_worker_threads)
+        futures = [executor.submit(run_job, *job) for job in jobs]
+        results = (future.result() for future in as_completed(futures))
+
+    try:
+        for image_path, output_path, success, seconds, megapixels, cached, events in results:
+            if recorder and events:
+                recorder.extend(events)
+            if success:
+                total_megapixels += megapixels
+            else:
+                failures += 1
+            cache_hits += cached and success
+            status = ("缓存" if cached else "完成") if success else "失败"
+            print(f"[{status}] {image_path} -> {output_path} ({seconds:.2f}s)")
+    finally:
+        if workers > 1:
+            executor.shutdown()
+        if writer:
+            # 等待全部写完, 写出失败的文件计入失败
+            for output_path, error in writer.close():
+                print(f"[失败] 写出 {output_path}: {error}")
+                failures += 1
+        if recorder and workers == 1:
+            instrument.disable()
+
+    elapsed = time.perf_counter() - start
+    done = len(paths) - failures
+    print(f"共 {len(paths)} 个文件, 成功 {done} (缓存命中 {cache_hits}), 失败 {failures}, 用时 {elapsed:.2f}s, "
+          f"{done / elapsed:.2f} 文件/秒, {total_megapixels / elapsed:.2f} 百万像素/秒")
+    if recorder:
+        recorder.write(args.trace)
+        print(recorder.summary())
+        print(f"计时记录已写入 {args.trace}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
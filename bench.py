@@ -0,0 +1,307 @@
+"""性能基准 - 测量各处理函数的耗时、吞吐量与峰值内存, 并与基准文件比较
+
+用法:
+    python bench.py --quick                          # 只测 256/1024 两种尺寸
+    python bench.py --sizes 1024 4096 --modes RGB --ops blur radial
+    python bench.py --output bench.json --save-baseline baseline.json
+    python bench.py --baseline baseline.json --margin 0.2   # 变慢超过20%时返回1
+    python bench.py --quick --ops radial blur --backends numpy numba   # 比较计算后端
+    python bench.py --quick --verify                 # 各后端的结果与numpy逐位比较
+
+输入全部在本地临时目录中合成, 不需要网络和样例图片。每个用例在单独的子进程中
+运行, 峰值内存 (常驻内存的最大值) 互不影响。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import processing
+from backends import available_backends, backend_name
+from engine import clear_radial_cache
+from noise import fbm_noise, white_noise_batch
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块, 不记录峰值内存
+    resource = None
+
+DEFAULT_SIZES = (256, 1024, 2048, 4096, 8192)
+QUICK_SIZES = (256, 1024)
+DEFAULT_MODES = ("L", "RGB", "RGBA")
+
+# 操作 -> 参数组合
+OPERATION_PARAMS = {
+    "normal": [{"strength": 5.0, "kernel": "central"}, {"strength": 5.0, "kernel": "sobel"}],
+    "blur": [{"radius": 3}, {"radius": 15}, {"radius": 50}, {"radius": 50, "quality": 8}],
+    "gaussian": [{"sigma": 1.0}, {"sigma": 10.0}, {"sigma": 100.0}, {"sigma": 100.0, "quality": 8}],
+    "radial": [{"strength": 0.02}, {"strength": 0.05}],
+    "noise": [{}],
+    "fbm": [{"layers": 4}, {"layers": 16}, {"layers": 64}],
+}
+
+# 以图像文件为输入的操作
+IMAGE_OPERATIONS = ("normal", "blur", "gaussian", "radial")
+
+# 输入图像或噪声图层超过此字节数的用例跳过 (如 64 层 8192² 的FBM)
+MAX_INPUT_BYTES = 1024 * 1024 * 1024
+
+# 与基准相差不到此秒数时不算退化, 避免毫秒级用例因计时抖动误报
+MIN_TIME_DELTA = 0.005
+
+
+def synthetic_image(size, mode, seed=0):
+    """合成测试图像: 平滑的分形噪声, 各通道使用不同种子"""
+    layers = [fbm_noise(size, size, octaves=4, scale=max(size / 8, 8), seed=seed + channel, kind="value")
+              for channel in range(len(mode))]
+    pixels = (np.stack(layers, axis=-1) * 255).astype(np.uint8)
+    return Image.fromarray(pixels[..., 0] if mode == "L" else pixels, mode)
+
+
+def build_cases(ops, sizes, modes, backends=None):
+    """生成用例列表: {名称, 操作, 尺寸, 模式, 参数, 后端}
+
+    给出 backends 时图像操作的每个用例对每个后端各测一次, 名称后加 @<后端>;
+    否则使用默认后端 (见 backends.get_backend)。
+    """
+    cases = []
+    for op in ops:
+        for params in OPERATION_PARAMS[op]:
+            for size in sizes:
+                for mode in (modes if op in IMAGE_OPERATIONS else ("L",)):
+                    layers = params.get("layers", 1)
+                    if size * size * len(mode) * layers > MAX_INPUT_BYTES:
+                        continue
+                    label = ",".join(f"{key}={value}" for key, value in params.items())
+                    name = "/".join(part for part in (op, label, mode, str(size)) if part)
+                    for backend in (backends if backends and op in IMAGE_OPERATIONS else (None,)):
+                        cases.append({"name": name + (f"@{backend}" if backend else ""), "op": op,
+                                      "size": size, "mode": mode, "params": params, "backend": backend})
+    return cases
+
+
+def _peak_rss_mb():
+    """当前进程常驻内存的峰值 (MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位, macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case, input_path, work_dir, repeat, output_path=None):
+    """在子进程中运行一个用例, 返回结果字典"""
+    op, size, params = case["op"], case["size"], dict(case["params"])
+    if op in IMAGE_OPERATIONS:
+        params["backend"] = case.get("backend")
+    output_path = output_path or os.path.join(work_dir, f"out_{os.getpid()}.png")
+    if op == "normal":
+        def call(path=input_path):
+            return processing.generate_normal_map(path, output_path, **params)
+    elif op == "blur":
+        def call(path=input_path):
+            return processing.apply_uniform_blur(path, output_path, **params)
+    elif op == "gaussian":
+        def call(path=input_path):
+            return processing.apply_gaussian_blur(path, output_path, **params)
+    elif op == "radial":
+        def call(path=input_path):
+            return processing.apply_radial_blur(path, output_path, **params)
+    elif op == "noise":
+        def call():
+            return processing.generate_noise_image(size, size, seed=0) is not None
+    else:
+        stack = white_noise_batch(params["layers"], size, size, seed=0)
+
+        def call():
+            return processing.fractal_brownian_motion(stack, output_path)
+
+    if op in IMAGE_OPERATIONS:
+        # 先在小图上调用一次, JIT后端的编译 (或加载磁盘缓存) 不计入耗时与峰值内存
+        warm_path = os.path.join(work_dir, f"warm_{os.getpid()}.png")
+        synthetic_image(16, case["mode"]).save(warm_path)
+        call(warm_path)
+    baseline_rss = _peak_rss_mb()
+    times = []
+    for _ in range(repeat):
+        # 每次都重新建立径向模糊的采样表, 与命令行逐个处理文件时相同
+        clear_radial_cache()
+        start = time.perf_counter()
+        if not call():
+            raise RuntimeError(f"{case['name']} 处理失败")
+        times.append(time.perf_counter() - start)
+    peak_rss = _peak_rss_mb()
+
+    megapixels = size * size * params.get("layers", 1) / 1e6
+    best = min(times)
+    return dict(case,
+                seconds=best,
+                median_seconds=statistics.median(times),
+                megapixels_per_second=megapixels / best,
+                peak_rss_mb=peak_rss,
+                peak_extra_mb=None if peak_rss is None else peak_rss - baseline_rss)
+
+
+def run_benchmarks(cases, repeat=3, progress=print):
+    """依次运行所有用例, 每个用例使用一个新的子进程"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_") as work_dir:
+        inputs = {}
+        for case in cases:
+            key = (case["size"], case["mode"])
+            if case["op"] in IMAGE_OPERATIONS and key not in inputs:
+                inputs[key] = os.path.join(work_dir, f"input_{case['mode']}_{case['size']}.png")
+                synthetic_image(case["size"], case["mode"]).save(inputs[key], compress_level=1)
+
+            input_path = inputs.get(key)
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_case, case, input_path, work_dir, repeat).result()
+            results.append(result)
+            if progress:
+                progress(format_result(result))
+    return results
+
+
+def verify_backends(cases, backends, progress=print):
+    """在同一输入上比较各后端与 numpy 后端的输出, 返回不一致的用例说明列表
+
+    输出写为 .npy (分块边算边写), 逐位比较; 只检查以图像为输入的操作。
+    """
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="bench_") as work_dir:
+        for case in cases:
+            if case["op"] not in IMAGE_OPERATIONS:
+                continue
+            input_path = os.path.join(work_dir, f"input_{case['mode']}_{case['size']}.png")
+            if not os.path.exists(input_path):
+                synthetic_image(case["size"], case["mode"]).save(input_path, compress_level=1)
+            outputs = {}
+            for backend in ["numpy"] + [name for name in backends if name != "numpy"]:
+                output_path = os.path.join(work_dir, f"out_{backend}.npy")
+                run_case(dict(case, backend=backend), input_path, work_dir, 1, output_path)
+                outputs[backend] = np.load(output_path)
+            reference = outputs.pop("numpy")
+            mismatched = [name for name, result in outputs.items() if not np.array_equal(result, reference)]
+            if mismatched:
+                failures.append(f"{case['name']}: {', '.join(mismatched)} 与 numpy 不一致")
+            if progress:
+                progress(f"[{'不一致' if mismatched else '一致'}] {case['name']} ({', '.join(outputs) or '-'})")
+    return failures
+
+
+def format_result(result):
+    memory = "-" if result["peak_extra_mb"] is None else f"{result['peak_extra_mb']:.0f} MB"
+    return (f"{result['name']:<42} {result['seconds'] * 1000:10.1f} ms "
+            f"{result['megapixels_per_second']:10.1f} MP/s  峰值 +{memory}")
+
+
+def environment():
+    """记录运行环境, 便于比较不同机器上的结果"""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "backend": backend_name(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def compare(results, baseline, margin, memory_margin=None):
+    """与基准结果比较, 返回超出允许范围的项目说明列表
+
+    耗时超过基准的 (1 + margin) 倍 (且多出 MIN_TIME_DELTA 以上), 或峰值内存超过基准的
+    (1 + memory_margin) 倍时判为退化; 基准中没有的用例不参与比较。
+    """
+    memory_margin = margin if memory_margin is None else memory_margin
+    reference = {item["name"]: item for item in baseline["results"]}
+    failures = []
+    for result in results:
+        base = reference.get(result["name"])
+        if base is None:
+            continue
+        limit = max(base["seconds"] * (1 + margin), base["seconds"] + MIN_TIME_DELTA)
+        if result["seconds"] > limit:
+            failures.append(f"{result['name']}: 耗时 {result['seconds']:.3f}s > {limit:.3f}s "
+                            f"(基准 {base['seconds']:.3f}s)")
+        if result.get("peak_extra_mb") is not None and base.get("peak_extra_mb") is not None:
+            # 小于1MB的波动不计
+            limit = max(base["peak_extra_mb"] * (1 + memory_margin), base["peak_extra_mb"] + 1)
+            if result["peak_extra_mb"] > limit:
+                failures.append(f"{result['name']}: 峰值内存 +{result['peak_extra_mb']:.0f}MB > "
+                                f"{limit:.0f}MB (基准 +{base['peak_extra_mb']:.0f}MB)")
+    return failures
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="bench.py", description="处理函数性能基准")
+    parser.add_argument("--ops", nargs="+", choices=sorted(OPERATION_PARAMS), default=sorted(OPERATION_PARAMS),
+                        help="要测试的操作")
+    parser.add_argument("--sizes", nargs="+", type=int, default=None, help="图像边长 (默认 256-8192)")
+    parser.add_argument("--modes", nargs="+", choices=DEFAULT_MODES, default=DEFAULT_MODES, help="图像模式")
+    parser.add_argument("--quick", action="store_true", help="只测 256 和 1024 两种尺寸")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例重复次数, 取最短耗时")
+    parser.add_argument("--output", default=None, help="结果JSON文件")
+    parser.add_argument("--baseline", default=None, help="基准JSON文件, 超出时返回1")
+    parser.add_argument("--margin", type=float, default=0.25, help="允许的耗时增幅 (默认0.25即25%%)")
+    parser.add_argument("--memory-margin", type=float, default=None, help="允许的峰值内存增幅 (默认同 --margin)")
+    parser.add_argument("--save-baseline", default=None, help="把本次结果写为基准文件")
+    parser.add_argument("--backends", nargs="+", choices=["numpy", "numba"], default=None,
+                        help="分别在这些计算后端上测试 (默认只用默认后端, 见 backends.py)")
+    parser.add_argument("--verify", action="store_true",
+                        help="不计时, 只检查各可用后端的结果与 numpy 逐位相同, 不一致时返回1")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    backends = args.backends
+    unavailable = sorted(set(backends or ()) - set(available_backends()))
+    if unavailable:
+        print(f"计算后端不可用 (未安装依赖): {', '.join(unavailable)}")
+        return 1
+
+    if args.verify:
+        backends = backends or available_backends()
+        cases = build_cases(args.ops, sizes, args.modes)
+        print(f"比较后端 {', '.join(backends)}: {len(cases)} 个用例")
+        failures = verify_backends(cases, backends)
+        for failure in failures:
+            print(f"  {failure}")
+        print(f"{len(failures)} 个用例不一致" if failures else "各后端结果一致")
+        return 1 if failures else 0
+
+    cases = build_cases(args.ops, sizes, args.modes, backends)
+    print(f"共 {len(cases)} 个用例, 每个重复 {args.repeat} 次")
+
+    report = {"environment": environment(), "results": run_benchmarks(cases, args.repeat)}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            print(f"结果已写入 {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        failures = compare(report["results"], baseline, args.margin, args.memory_margin)
+        if failures:
+            print(f"性能退化 ({len(failures)} 项):")
+            for failure in failures:
+                print(f"  {failure}")
+            return 1
+        print("未超出基准")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
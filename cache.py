@@ -0,0 +1,171 @@
+"""处理结果缓存 - 以输入像素的哈希加操作名与参数为键
+
+内存层与磁盘层各有字节上限, 超出时按最近最少使用 (LRU) 淘汰。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+DEFAULT_DISK_LIMIT = 2 * 1024 * 1024 * 1024
+
+
+def digest_array(array):
+    """像素内容摘要 (包含形状与数据类型)"""
+    array = np.ascontiguousarray(array)
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f"{array.dtype.str}{array.shape}".encode())
+    hasher.update(memoryview(array).cast("B"))
+    return hasher.hexdigest()
+
+
+def make_key(digest, steps):
+    """由源摘要和处理步骤 [(名称, 参数), ...] 生成结果的键"""
+    recipe = json.dumps([digest, steps], sort_keys=True, default=str)
+    return hashlib.blake2b(recipe.encode(), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """两级结果缓存: 内存中的数组 + 磁盘上的 .npy 文件"""
+
+    def __init__(self, directory=None, memory_limit=DEFAULT_MEMORY_LIMIT,
+                 disk_limit=DEFAULT_DISK_LIMIT):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.lock = threading.Lock()
+
+        self.memory = OrderedDict()  # 键 -> 数组
+        self.memory_bytes = 0
+        self.disk = OrderedDict()    # 键 -> 文件字节数
+        self.disk_bytes = 0
+        self.paths = {}              # (路径, 修改时间, 大小, 数组格式) -> 像素摘要
+        self.outputs = {}            # 输出路径 -> (键, 修改时间)
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        """按修改时间从旧到新恢复磁盘层的LRU顺序"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_bytes += size
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    @staticmethod
+    def _file_id(path, layout=None):
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size, layout
+
+    def lookup_path(self, path, layout=None):
+        """已知文件 (路径、修改时间和大小都未变) 的像素摘要, 避免重复解码
+
+        layout 为数组文件的 (形状, 数据类型): 同一个 raw 文件按不同的 raw_shape / raw_dtype
+        解释时像素不同, 摘要分开记录。
+        """
+        return self.paths.get(self._file_id(path, layout))
+
+    def remember_path(self, path, digest, layout=None):
+        self.paths[self._file_id(path, layout)] = digest
+
+    def get(self, key):
+        """查找结果, 未命中返回 None; 返回的数组为只读"""
+        with self.lock:
+            array = self.memory.get(key)
+            if array is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return array
+            # 其它进程可能已写入同一目录, 所以也检查索引之外的文件
+            if key in self.disk or (self.directory and os.path.exists(self._disk_path(key))):
+                try:
+                    array = np.load(self._disk_path(key))
+                    os.utime(self._disk_path(key))
+                except (OSError, ValueError):
+                    if key in self.disk:
+                        self._drop_disk(key)
+                else:
+                    if key not in self.disk:
+                        self.disk[key] = os.path.getsize(self._disk_path(key))
+                        self.disk_bytes += self.disk[key]
+                    self.disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._put_memory(key, array)
+                    return array
+            self.misses += 1
+            return None
+
+    def put(self, key, array):
+        """保存结果到内存层与磁盘层"""
+        with self.lock:
+            self._put_memory(key, array)
+            if self.directory and key not in self.disk:
+                self._put_disk(key, array)
+
+    def _put_memory(self, key, array):
+        array.flags.writeable = False
+        if array.nbytes > self.memory_limit:
+            return
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key).nbytes
+        self.memory[key] = array
+        self.memory_bytes += array.nbytes
+        while self.memory_bytes > self.memory_limit:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+
+    def _put_disk(self, key, array):
+        # 先写临时文件再改名, 多个进程共用目录时不会读到半个文件
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            np.save(file, array)
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+        self.disk[key] = size
+        self.disk_bytes += size
+        while self.disk_bytes > self.disk_limit and self.disk:
+            self._drop_disk(next(iter(self.disk)))
+
+    def _drop_disk(self, key):
+        self.disk_bytes -= self.disk.pop(key)
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def output_current(self, output_path, key):
+        """输出文件是否已经是该结果且之后未被改动"""
+        record = self.outputs.get(os.path.abspath(output_path))
+        if record is None or record[0] != key or not os.path.exists(output_path):
+            return False
+        return os.stat(output_path).st_mtime_ns == record[1]
+
+    def record_output(self, output_path, key):
+        self.outputs[os.path.abspath(output_path)] = (key, os.stat(output_path).st_mtime_ns)
+
+    def stats(self):
+        """命中/未命中计数与各层占用"""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+        }
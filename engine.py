@@ -0,0 +1,737 @@
+"""图像处理计算内核 - 整幅数组的NumPy实现, 不依赖任何界面库"""
+import functools
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+# 法向贴图可选的梯度核: 名称 -> 垂直于差分方向的平滑权重
+# central 为原始的中心差分, sobel/scharr 在差分的同时做一次平滑
+NORMAL_KERNELS = {
+    "central": None,
+    "sobel": (1.0, 2.0, 1.0),
+    "scharr": (3.0, 10.0, 3.0),
+}
+
+
+def _smooth_rows(diff, weights):
+    """沿第0轴对差分结果做3点平滑, 返回去掉首尾两行后的结果"""
+    if weights is None:
+        return diff[1:-1].copy()
+    a, b, c = weights
+    smoothed = diff[1:-1] * np.float32(b)
+    smoothed += diff[:-2] * np.float32(a)
+    smoothed += diff[2:] * np.float32(c)
+    smoothed *= np.float32(1.0 / (a + b + c))
+    return smoothed
+
+
+def _normal_field(pixels, strength, kernel):
+    """去掉一圈边界后的单位法向量分量 (x, y, z), 均为float32数组"""
+    if kernel not in NORMAL_KERNELS:
+        raise ValueError(f"未知的梯度核: {kernel}")
+    weights = NORMAL_KERNELS[kernel]
+
+    # 16位高度图换算到与8位相同的 0-255 尺度, 保留小数精度
+    scale = 1.0 / 255.0
+    if np.asarray(pixels).dtype == np.uint16:
+        scale /= 257.0
+    gray = np.asarray(pixels, dtype=np.float32)
+    if gray.ndim != 2:
+        raise ValueError("法向贴图需要单通道灰度数组")
+    height, width = gray.shape
+    if height < 3 or width < 3:
+        raise ValueError("图像尺寸至少需要3x3像素")
+
+    # 计算梯度 (x方向差分后沿y平滑, y方向差分后沿x平滑)
+    dx = _smooth_rows(gray[:, 2:] - gray[:, :-2], weights)
+    dy = _smooth_rows((gray[2:] - gray[:-2]).T, weights).T
+    del gray
+    dx *= np.float32(scale)
+    dy *= np.float32(scale)
+
+    # 计算法向量长度的倒数
+    dz = np.float32(1.0 / strength)
+    inv_length = dx * dx
+    inv_length += dy * dy
+    inv_length += dz * dz
+    np.sqrt(inv_length, out=inv_length)
+    np.reciprocal(inv_length, out=inv_length)
+
+    dx *= inv_length
+    dy *= inv_length
+    inv_length *= dz
+    return dx, dy, inv_length
+
+
+def _replicate_border(array):
+    """边界一圈复制相邻的一行/一列"""
+    array[0] = array[1]
+    array[-1] = array[-2]
+    array[:, 0] = array[:, 1]
+    array[:, -1] = array[:, -2]
+    return array
+
+
+def compute_normal_map(pixels, strength=5.0, kernel="central"):
+    """由灰度数组 (8位或16位) 计算法向贴图, 返回 (高, 宽, 3) 的uint8数组
+
+    中间结果全部使用float32, 边界像素复制相邻一行/一列, 与逐像素版本一致。
+    """
+    components = _normal_field(pixels, strength, kernel)
+    height, width = components[0].shape
+    normal_map = np.empty((height + 2, width + 2, 3), dtype=np.uint8)
+
+    # 转换到RGB范围 (0-255), 截断取整与原实现的 int() 相同
+    for channel, component in enumerate(components):
+        component += np.float32(1.0)
+        component *= np.float32(127.5)
+        normal_map[1:-1, 1:-1, channel] = component
+    return _replicate_border(normal_map)
+
+
+def _encode_normals(planes, out):
+    """x, y, z 三个单位向量分量 (float32) 编码为RGB写入 out, 取整方式与 compute_normal_map 相同"""
+    component = np.empty(planes[0].shape, dtype=np.float32)
+    for channel, plane in enumerate(planes):
+        np.add(plane, np.float32(1.0), out=component)
+        component *= np.float32(127.5)
+        out[..., channel] = component
+    return out
+
+
+def _fold_pairs(values):
+    """沿行、列两两相加, 宽高减半 (向下取整, 最小为1); 奇数边长时最后一行/列并入最后一组"""
+    if values.shape[0] > 1:
+        half = values.shape[0] // 2
+        summed = values[0:2 * half:2] + values[1:2 * half:2]
+        if values.shape[0] % 2:
+            summed[-1] += values[-1]
+        values = summed
+    if values.shape[1] > 1:
+        half = values.shape[1] // 2
+        summed = values[:, 0:2 * half:2] + values[:, 1:2 * half:2]
+        if values.shape[1] % 2:
+            summed[:, -1] += values[:, -1]
+        values = summed
+    return values
+
+
+def _fold_padded(values, axis):
+    """同 _fold_pairs 的一个方向, 但按两端各复制一行/列之后的数组计算, 不实际补边
+
+    补边后第 k 组为原数组的第 2k-1、2k 行; 第一组和偶数长度时的最后一组是同一行加两次。
+    """
+    count = values.shape[axis]
+    half = (count + 2) // 2
+    shape = list(values.shape)
+    shape[axis] = half
+    out = np.empty(shape, dtype=values.dtype)
+    source, target = np.moveaxis(values, axis, 0), np.moveaxis(out, axis, 0)
+    np.add(source[0], source[0], out=target[0])
+    pairs = min(half - 1, (count - 1) // 2)
+    np.add(source[1:2 * pairs:2], source[2:2 * pairs + 1:2], out=target[1:pairs + 1])
+    if pairs < half - 1:
+        np.add(source[-1], source[-1], out=target[-1])
+    if count % 2:
+        target[-1] += source[-1]
+    return out
+
+
+def _normalize_sums(planes):
+    """按块求和后的法向量重新归一化 (原地), 和为零时取 (0, 0, 1)"""
+    length = planes[0] * planes[0]
+    length += planes[1] * planes[1]
+    length += planes[2] * planes[2]
+    np.sqrt(length, out=length)
+    flat = length == 0
+    if flat.any():
+        planes[2][flat] = 1.0
+        length[flat] = 1.0
+    for plane in planes:
+        plane /= length
+    return planes
+
+
+def _downsample_normals(planes):
+    """法向量场缩小一级, 按块求和后重新归一化
+
+    直接平均RGB会让法向量变短 (坡度被压平), 这里对向量求和再除以长度, 保持单位长度。
+    """
+    return _normalize_sums([_fold_pairs(plane) for plane in planes])
+
+
+def compute_normal_mips(pixels, strength=5.0, kernel="central", levels=None):
+    """法向贴图的完整mip链: 梯度只在第0级计算一次, 之后逐级缩小法向量场并重新归一化
+
+    返回 [(高, 宽, 3) uint8, ...], 第0级与 compute_normal_map 相同, 之后每级宽高减半
+    (向下取整) 直到 1x1, 或只生成 levels 级。第1级直接由去掉边界的法向量场求和
+    (边界按复制计算, 不补边), 其后各级只有上一级的1/4; 总耗时约为单张法向贴图的1.3-1.4倍。
+    """
+    planes = _normal_field(pixels, strength, kernel)
+    height, width = planes[0].shape
+    top = np.empty((height + 2, width + 2, 3), dtype=np.uint8)
+    _encode_normals(planes, top[1:-1, 1:-1])
+    chain = [_replicate_border(top)]
+    if levels is not None and levels <= 1:
+        return chain
+    planes = _normalize_sums([_fold_padded(_fold_padded(plane, 0), 1) for plane in planes])
+    while True:
+        chain.append(_encode_normals(planes, np.empty(planes[0].shape + (3,), dtype=np.uint8)))
+        if (levels is not None and len(chain) >= levels) or max(planes[0].shape) == 1:
+            return chain
+        planes = _downsample_normals(planes)
+
+
+def pack_mips(chain):
+    """把mip链排成一张图: 第0级在左, 其余各级自上而下排在右侧一列
+
+    返回 (图像数组, [(left, upper, 宽, 高), ...] 各级所在区域)。
+    """
+    height, width = chain[0].shape[:2]
+    right = max((level.shape[1] for level in chain[1:]), default=0)
+    total = max(height, sum(level.shape[0] for level in chain[1:]))
+    packed = np.zeros((total, width + right) + chain[0].shape[2:], dtype=chain[0].dtype)
+    packed[:height, :width] = chain[0]
+    boxes = [(0, 0, width, height)]
+    upper = 0
+    for level in chain[1:]:
+        level_height, level_width = level.shape[:2]
+        packed[upper:upper + level_height, width:width + level_width] = level
+        boxes.append((width, upper, level_width, level_height))
+        upper += level_height
+    return packed, boxes
+
+
+def _window_bounds(size, radius):
+    """每个位置的邻域窗口 [lo, hi), 在边界处收缩"""
+    index = np.arange(size)
+    lo = np.maximum(index - radius, 0)
+    hi = np.minimum(index + radius + 1, size)
+    return lo, hi
+
+
+def _box_sum(values, radius, axis, acc_dtype):
+    """沿指定轴做滑动窗口求和 (前缀和相减, 耗时与半径无关)"""
+    size = values.shape[axis]
+    shape = list(values.shape)
+    shape[axis] = size + 1
+    prefix = np.zeros(shape, dtype=acc_dtype)
+    body = [slice(None)] * values.ndim
+    body[axis] = slice(1, None)
+    np.cumsum(values, axis=axis, dtype=acc_dtype, out=prefix[tuple(body)])
+
+    lo, hi = _window_bounds(size, radius)
+    sums = np.take(prefix, hi, axis=axis)
+    sums -= np.take(prefix, lo, axis=axis)
+    return sums
+
+
+# 8/16位整数输入的快速路径: 用uint32累加 (前缀和允许回绕, 相减后的窗口和仍然精确),
+# 除法改为乘以定点倒数 ceil(2^48/n) 再右移48位; 窗口像素数 n 满足
+# n*n*最大值 < 2^48 时与整除的结果逐位相同, 否则退回int64累加
+RECIPROCAL_SHIFT = 48
+# 定点除法每次处理的元素数 (uint64中间结果的大小)
+RECIPROCAL_CHUNK = 1 << 20
+
+
+def _fixed_point_exact(count, dtype):
+    """最多 count 个 dtype 像素求和后, 整数快速路径是否与整除结果相同"""
+    if dtype not in (np.uint8, np.uint16):
+        return False
+    return count * count * int(np.iinfo(dtype).max) < 2 ** RECIPROCAL_SHIFT
+
+
+def _reciprocals(counts):
+    """除数的定点倒数 ceil(2^48 / n), uint64"""
+    counts = np.asarray(counts, dtype=np.uint64)
+    return np.uint64(2 ** RECIPROCAL_SHIFT - 1) // counts + np.uint64(1)
+
+
+def _divide_fixed(sums, reciprocals, out):
+    """out[...] = sums // n, reciprocals 为 n 的定点倒数 (可广播)"""
+    product = sums.astype(np.uint64)
+    product *= reciprocals
+    product >>= np.uint64(RECIPROCAL_SHIFT)
+    out[...] = product
+
+
+def _divide_windows(sums, counts_y, counts_x, out):
+    """uint32窗口和除以各像素的窗口大小 counts_y * counts_x, 写入 out
+
+    内部像素的窗口大小相同, 共用一个倒数并按行分批计算; 只有边界的几条窄带需要逐像素的倒数。
+    """
+    height, width = sums.shape[:2]
+    extra = (1,) * (sums.ndim - 2)
+    top = int(np.argmax(counts_y == counts_y.max()))
+    bottom = height - int(np.argmax(counts_y[::-1] == counts_y.max()))
+    left = int(np.argmax(counts_x == counts_x.max()))
+    right = width - int(np.argmax(counts_x[::-1] == counts_x.max()))
+
+    inner = _reciprocals(int(counts_y.max()) * int(counts_x.max()))
+    rows = max(1, RECIPROCAL_CHUNK // max(sums[0, left:right].size, 1))
+    for start in range(top, bottom, rows):
+        stop = min(start + rows, bottom)
+        _divide_fixed(sums[start:stop, left:right], inner, out[start:stop, left:right])
+
+    for (y0, y1), (x0, x1) in (((0, top), (0, width)), ((bottom, height), (0, width)),
+                               ((top, bottom), (0, left)), ((top, bottom), (right, width))):
+        if y1 > y0 and x1 > x0:
+            counts = np.multiply.outer(counts_y[y0:y1], counts_x[x0:x1])
+            _divide_fixed(sums[y0:y1, x0:x1], _reciprocals(counts).reshape(counts.shape + extra),
+                          out[y0:y1, x0:x1])
+    return out
+
+
+def compute_uniform_blur(pixels, radius=3):
+    """对 (高, 宽) 或 (高, 宽, 通道) 数组做盒式模糊, 保持原数据类型
+
+    使用可分离的前缀和, 每个像素的开销与半径无关;
+    边界处的窗口收缩为图像内的部分, 与逐像素求平均的结果一致。
+    8/16位输入用uint32累加和定点倒数除法, 结果与int64整除相同, 内存带宽约减半。
+    """
+    pixels = np.asarray(pixels)
+    if radius < 0:
+        raise ValueError("模糊半径不能为负数")
+    if radius == 0:
+        return pixels.copy()
+
+    integer = np.issubdtype(pixels.dtype, np.integer)
+    height, width = pixels.shape[:2]
+    # 每个像素实际参与平均的邻域大小
+    lo_y, hi_y = _window_bounds(height, radius)
+    lo_x, hi_x = _window_bounds(width, radius)
+    counts_y = hi_y - lo_y
+    counts_x = hi_x - lo_x
+
+    if _fixed_point_exact(int(counts_y.max()) * int(counts_x.max()), pixels.dtype):
+        sums = _box_sum(pixels, radius, 0, np.uint32)
+        sums = _box_sum(sums, radius, 1, np.uint32)
+        return _divide_windows(sums, counts_y, counts_x, np.empty(pixels.shape, pixels.dtype))
+
+    acc_dtype = np.int64 if integer else np.float64
+    # 先竖直后水平两次一维窗口求和
+    sums = _box_sum(pixels, radius, 0, acc_dtype)
+    sums = _box_sum(sums, radius, 1, acc_dtype)
+
+    counts = np.outer(counts_y, counts_x)
+    if pixels.ndim == 3:
+        counts = counts[:, :, np.newaxis]
+
+    # 整数图像用整除, 与原实现把浮点均值截断写回的结果相同
+    if integer:
+        sums //= counts
+    else:
+        sums /= counts
+    return sums.astype(pixels.dtype)
+
+
+# 高斯模糊: sigma 不小于此值时用多次扩展盒式滤波近似, 更小时直接用采样的高斯核
+GAUSSIAN_BOX_MIN_SIGMA = 2.0
+# 每个方向的扩展盒式滤波次数
+GAUSSIAN_PASSES = 4
+# 直接卷积时高斯核截断在 ±GAUSSIAN_TRUNCATE*sigma
+GAUSSIAN_TRUNCATE = 4.0
+# 整数图像的中间结果使用定点数, 小数位数
+GAUSSIAN_FRACTION_BITS = 8
+# 分段计算时每段的元素数 (限制前缀和等临时数组的大小)
+GAUSSIAN_CHUNK = 1 << 20
+
+
+@functools.lru_cache(maxsize=64)
+def gaussian_box_pass(sigma, passes=GAUSSIAN_PASSES):
+    """单次扩展盒式滤波的 (半径 r, 端点权重 alpha)
+
+    核为 [alpha, 1, ..., 1, alpha] (中间 2r+1 个1) 归一化, 连续 passes 次的方差
+    恰好等于 sigma² (Gwosdek 等的扩展盒式滤波), 不受整数宽度限制。
+    """
+    variance = sigma * sigma / passes
+    r = int(np.floor(0.5 * np.sqrt(12.0 * variance + 1.0) - 0.5))
+    alpha = (2 * r + 1) * (r * (r + 1) - 3.0 * variance) / (6.0 * (variance - (r + 1) ** 2))
+    return r, alpha
+
+
+def gaussian_halo(sigma):
+    """高斯模糊每侧需要的源像素数 (复制边缘补齐到此宽度)"""
+    if sigma <= 0:
+        return 0
+    if sigma < GAUSSIAN_BOX_MIN_SIGMA:
+        return int(np.ceil(GAUSSIAN_TRUNCATE * sigma))
+    r, _ = gaussian_box_pass(float(sigma))
+    return GAUSSIAN_PASSES * (r + 1)
+
+
+def _extended_box_pass(values, r, alpha, axis, integer):
+    """沿指定轴做一次扩展盒式滤波, 该轴两端各缩短 r+1 (只保留完整窗口)
+
+    窗口内求和用前缀和相减, 与半径无关。整数图像的中间结果为取整后的定点数,
+    float64 的前缀和对不超过 2^53 的整数是精确的, 之后只有逐元素运算,
+    因此分块计算与整幅计算逐位相同。
+    """
+    values = np.swapaxes(values, 0, axis)
+    k = r + 1
+    size = values.shape[0] - 2 * k
+    prefix = np.empty((values.shape[0] + 1,) + values.shape[1:], dtype=np.float64)
+    prefix[0] = 0
+    np.cumsum(values, axis=0, out=prefix[1:])
+    sums = np.subtract(prefix[2 * k:2 * k + size], prefix[1:1 + size])
+    del prefix
+    ends = np.add(values[:size], values[2 * k:2 * k + size])
+    ends *= alpha
+    sums += ends
+    del ends
+    sums *= 1.0 / (2 * r + 1 + 2 * alpha)
+    if integer:
+        np.rint(sums, out=sums)
+    return np.swapaxes(sums, 0, axis)
+
+
+def _gaussian_kernel_pass(values, sigma, axis):
+    """沿指定轴与截断的采样高斯核做卷积, 该轴两端各缩短核半径"""
+    radius = int(np.ceil(GAUSSIAN_TRUNCATE * sigma))
+    weights = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    weights /= weights.sum()
+    values = np.swapaxes(values, 0, axis)
+    size = values.shape[0] - 2 * radius
+    result = values[:size] * weights[0]
+    for offset in range(1, 2 * radius + 1):
+        result += values[offset:offset + size] * weights[offset]
+    return np.swapaxes(result, 0, axis)
+
+
+def gaussian_kernel(sigma):
+    """compute_gaussian_blur 实际使用的一维核 (中心在中间)
+
+    sigma 小于 GAUSSIAN_BOX_MIN_SIGMA 时为截断的采样高斯核, 否则为扩展盒式核
+    [alpha, 1, ..., 1, alpha] 自身卷积 GAUSSIAN_PASSES 次。
+    """
+    if sigma < GAUSSIAN_BOX_MIN_SIGMA:
+        radius = int(np.ceil(GAUSSIAN_TRUNCATE * sigma))
+        kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+        return kernel / kernel.sum()
+    r, alpha = gaussian_box_pass(float(sigma))
+    box = np.ones(2 * r + 3)
+    box[0] = box[-1] = alpha
+    box /= box.sum()
+    kernel = np.ones(1)
+    for _ in range(GAUSSIAN_PASSES):
+        kernel = np.convolve(kernel, box)
+    return kernel
+
+
+def gaussian_error_bound(sigma, maxval=255):
+    """compute_gaussian_blur 与精确高斯核相比, 每个像素误差的上界 (像素值单位)
+
+    精确核为 ±6σ 内的采样高斯核归一化, 边界同样复制边缘像素。两个二维核 K、G 都是
+    一维核的外积且和为1, 对取值在 [0, maxval] 的任意图像, 卷积结果之差不超过
+    maxval·½‖K−G‖₁ (在 K>G 处取 maxval、其余取0的图像恰好达到); 边界复制只会把核的
+    权重折叠到一起, 不会增大这个值。整数图像再加上取整误差: 中间定点数每次
+    不超过 0.5/2^GAUSSIAN_FRACTION_BITS, 最终取整不超过0.5。
+    """
+    if sigma <= 0:
+        return 0.0
+    actual = gaussian_kernel(sigma)
+    half = max(len(actual) // 2, int(np.ceil(6 * sigma)))
+    exact = np.exp(-0.5 * (np.arange(-half, half + 1) / sigma) ** 2)
+    exact /= exact.sum()
+    offset = half - len(actual) // 2
+    padded = np.zeros_like(exact)
+    padded[offset:offset + len(actual)] = actual
+    # ‖a⊗a − g⊗g‖₁ 逐行累加, 避免生成整个二维核
+    total = 0.0
+    for weight, exact_weight in zip(padded, exact):
+        total += np.abs(weight * padded - exact_weight * exact).sum()
+    rounding = 0.5
+    if sigma >= GAUSSIAN_BOX_MIN_SIGMA:
+        rounding += 2 * GAUSSIAN_PASSES * 0.5 / (1 << GAUSSIAN_FRACTION_BITS)
+    return maxval * 0.5 * total + rounding
+
+
+def _gaussian_axis(values, sigma, axis, integer, out, scale=1.0, finish=None):
+    """沿 axis 做一维高斯模糊 (该轴两端各缩短 gaussian_halo), 结果写入 out
+
+    另一个轴上各行/列互不相关, 分段计算: 每段转换为float64并乘以 scale, 模糊后
+    经过 finish 再写入 out, 临时数组的大小与 GAUSSIAN_CHUNK 成正比。
+    """
+    other = 1 - axis
+    step = max(1, GAUSSIAN_CHUNK // max(values.size // max(values.shape[other], 1), 1))
+    if sigma >= GAUSSIAN_BOX_MIN_SIGMA:
+        r, alpha = gaussian_box_pass(float(sigma))
+    for start in range(0, values.shape[other], step):
+        index = (slice(None),) * other + (slice(start, start + step),)
+        chunk = np.asarray(values[index], dtype=np.float64)
+        if scale != 1.0:
+            chunk = chunk * scale
+        if sigma < GAUSSIAN_BOX_MIN_SIGMA:
+            chunk = _gaussian_kernel_pass(chunk, sigma, axis)
+        else:
+            for _ in range(GAUSSIAN_PASSES):
+                chunk = _extended_box_pass(chunk, r, alpha, axis, integer)
+        out[index] = chunk if finish is None else finish(chunk)
+    return out
+
+
+def gaussian_blur_padded(padded, sigma, dtype, pad_x=(0, 0)):
+    """对四周已补 gaussian_halo(sigma) 像素的数组做高斯模糊, 返回去掉补边后的结果
+
+    pad_x 为左右两侧还没有补、需要复制边缘列补齐的列数 (图像左右边界处)。
+    先做竖直方向: 复制出来的列竖直模糊后仍与边缘列相同, 因此只在竖直方向之后
+    补列, 竖直方向不必计算这些列。两个方向都分段计算, 整幅的中间结果只有一份
+    float64 (每个像素每通道8字节), 临时内存与 sigma 无关。
+    """
+    padded = np.asarray(padded)
+    integer = np.issubdtype(dtype, np.integer)
+    # 整数图像盒式近似的中间结果为 GAUSSIAN_FRACTION_BITS 位小数的定点数
+    fixed = float(1 << GAUSSIAN_FRACTION_BITS) if integer and sigma >= GAUSSIAN_BOX_MIN_SIGMA else 1.0
+    halo = gaussian_halo(sigma)
+    left, right = pad_x
+    height, width = padded.shape[0] - 2 * halo, padded.shape[1]
+    columns = np.empty((height, left + width + right) + padded.shape[2:], dtype=np.float64)
+    _gaussian_axis(padded, sigma, 0, integer, columns[:, left:left + width], scale=fixed)
+    columns[:, :left] = columns[:, left:left + 1]
+    if right:
+        columns[:, -right:] = columns[:, -right - 1:-right]
+
+    def finish(chunk):
+        if integer:
+            if fixed != 1.0:
+                chunk *= 1.0 / fixed
+            info = np.iinfo(dtype)
+            chunk = np.clip(np.rint(chunk), info.min, info.max)
+        return chunk
+    out = np.empty((height, columns.shape[1] - 2 * halo) + padded.shape[2:], dtype=dtype)
+    return _gaussian_axis(columns, sigma, 1, integer, out, finish=finish)
+
+
+def compute_gaussian_blur(pixels, sigma=2.0):
+    """对 (高, 宽) 或 (高, 宽, 通道) 数组做高斯模糊, 保持原数据类型
+
+    sigma 不小于 GAUSSIAN_BOX_MIN_SIGMA 时用 GAUSSIAN_PASSES 次扩展盒式滤波近似,
+    每个像素的开销与 sigma 无关; 更小的 sigma 直接与采样高斯核卷积。
+    边界按复制边缘像素处理。与精确高斯核 (±6σ 采样) 相比每个像素的误差不超过
+    gaussian_error_bound(sigma): 对 0-255 的图像, 盒式近似时不超过8级 (sigma≈2.8 时
+    最大, 大 sigma 约7.6级; 只有专门构造的图案才接近, 自然图像上约1级),
+    直接卷积时只有取整误差 (约0.5级)。
+    """
+    pixels = np.asarray(pixels)
+    if sigma < 0:
+        raise ValueError("高斯模糊的sigma不能为负数")
+    if sigma == 0:
+        return pixels.copy()
+    halo = gaussian_halo(sigma)
+    pad = ((halo, halo), (0, 0)) + ((0, 0),) * (pixels.ndim - 2)
+    return gaussian_blur_padded(np.pad(pixels, pad, mode="edge"), sigma, pixels.dtype, (halo, halo))
+
+
+# 径向模糊采样表: box 为采样覆盖的源区域 (left, upper, right, lower),
+# order 为按采样数从多到少排列的输出像素, steps[i] 为第i步的源像素索引 (int32),
+# counts 为每个输出像素 (按 order 排列) 的有效采样数
+RadialTables = namedtuple("RadialTables", ["box", "order", "steps", "counts"])
+
+# 整幅图像采样表的缓存上限 (字节), 超出时按最近最少使用淘汰;
+# 2048x2048、强度0.02 的一组表约300MB, 超过上限的表不缓存
+RADIAL_CACHE_LIMIT = 512 * 1024 * 1024
+_radial_cache = OrderedDict()  # (宽, 高, cx, cy, 强度) -> RadialTables
+_radial_cache_bytes = 0
+_radial_cache_lock = threading.Lock()
+
+# apply_radial_tables 每次累加的输出像素数, 累加器在各步之间留在缓存中
+RADIAL_CHUNK = 1 << 16
+
+
+def _radial_tables_bytes(tables):
+    return sum(table.nbytes for table in (tables.order, tables.counts) + tables.steps)
+
+
+def clear_radial_cache():
+    """清空径向模糊采样表的缓存"""
+    global _radial_cache_bytes
+    with _radial_cache_lock:
+        _radial_cache.clear()
+        _radial_cache_bytes = 0
+
+
+def radial_blur_tables(width, height, cx, cy, strength, window=None):
+    """构建径向模糊的采样索引表
+
+    window 为需要计算的输出区域 (left, upper, right, lower), 默认整幅图像。
+    采样规则与逐像素版本相同: 沿指向中心的方向取 int(距离*强度)+1 个点,
+    坐标向零截断, 超出图像的采样点不计入平均。
+    只缓存整幅图像的表 (总量不超过 RADIAL_CACHE_LIMIT); 分块处理时每块的表只用一次, 不缓存。
+    """
+    global _radial_cache_bytes
+    if window is not None and tuple(window) != (0, 0, width, height):
+        return _build_radial_tables(width, height, cx, cy, strength, window)
+    key = (width, height, cx, cy, strength)
+    with _radial_cache_lock:
+        if key in _radial_cache:
+            _radial_cache.move_to_end(key)
+            return _radial_cache[key]
+    tables = _build_radial_tables(width, height, cx, cy, strength, (0, 0, width, height))
+    size = _radial_tables_bytes(tables)
+    if size > RADIAL_CACHE_LIMIT:
+        return tables
+    with _radial_cache_lock:
+        if key not in _radial_cache:
+            _radial_cache[key] = tables
+            _radial_cache_bytes += size
+        while _radial_cache_bytes > RADIAL_CACHE_LIMIT:
+            _, evicted = _radial_cache.popitem(last=False)
+            _radial_cache_bytes -= _radial_tables_bytes(evicted)
+    return tables
+
+
+def _build_radial_tables(width, height, cx, cy, strength, window):
+    """构建 window 区域的采样表 (见 radial_blur_tables), 不缓存"""
+    left, upper, right, lower = window
+    ys, xs = np.mgrid[upper:lower, left:right]
+    xs = xs.ravel().astype(np.float64)
+    ys = ys.ravel().astype(np.float64)
+
+    # 方向与距离
+    dx = xs - cx
+    dy = ys - cy
+    distance = np.sqrt(dx * dx + dy * dy)
+    samples = (distance * strength).astype(np.int64) + 1
+    nonzero = distance > 0
+    dx[nonzero] /= distance[nonzero]
+    dy[nonzero] /= distance[nonzero]
+    del distance, nonzero
+
+    # 采样数多的像素排在前面, 第i步只需处理前 active[i] 个像素
+    order = np.argsort(-samples, kind="stable")
+    xs, ys, dx, dy = xs[order], ys[order], dx[order], dy[order]
+    samples = samples[order]
+    step_count = int(samples[0]) if len(samples) else 0
+    active = np.searchsorted(-samples, -np.arange(step_count), side="left")
+
+    # 采样坐标沿射线单调变化, 覆盖范围由每条射线的首尾两点决定;
+    # 末点都在图像内时所有采样点都在图像内, 不需要逐步判断
+    last = samples - 1
+    end_x = np.trunc(xs - dx * last).astype(np.int64)
+    end_y = np.trunc(ys - dy * last).astype(np.int64)
+    clipped = not np.all((end_x >= 0) & (end_x < width) & (end_y >= 0) & (end_y < height))
+    box = (left, upper, right, lower)
+    if len(samples):
+        # 末点在图像外时只有图像内的一段有效, 截到图像边界仍包含全部有效采样
+        np.clip(end_x, 0, width - 1, out=end_x)
+        np.clip(end_y, 0, height - 1, out=end_y)
+        box = (min(left, int(end_x.min())), min(upper, int(end_y.min())),
+               max(right, int(end_x.max()) + 1), max(lower, int(end_y.max()) + 1))
+    del end_x, end_y, last
+
+    # 转换为源区域内的一维索引, 图像外的采样指向末尾补零的哨兵位置
+    box_width = box[2] - box[0]
+    sentinel = box_width * (box[3] - box[1])
+    index_dtype = np.int32 if sentinel < 2 ** 31 else np.int64
+    offset = box[1] * box_width + box[0]
+    counts = np.zeros(len(order), dtype=np.int32) if clipped else samples.astype(np.int32)
+    steps = []
+    for i, k in enumerate(active):
+        # xs - dx*i 逐位等于 xs + dx*(-i), 在缓冲区内原地计算
+        sample_x = dx[:k] * -i
+        sample_x += xs[:k]
+        np.trunc(sample_x, out=sample_x)
+        sample_y = dy[:k] * -i
+        sample_y += ys[:k]
+        np.trunc(sample_y, out=sample_y)
+        if clipped:
+            inside = (sample_x >= 0) & (sample_x < width) & (sample_y >= 0) & (sample_y < height)
+            counts[:k] += inside
+        # 坐标都是整数, 在float64中精确计算索引
+        sample_y *= box_width
+        sample_y += sample_x
+        sample_y -= offset
+        index = sample_y.astype(index_dtype)
+        if clipped:
+            index[~inside] = sentinel
+        index.flags.writeable = False
+        steps.append(index)
+
+    order = order.astype(np.int32 if len(order) < 2 ** 31 else np.int64)
+    for table in (order, counts):
+        table.flags.writeable = False
+    return RadialTables(box, order, tuple(steps), counts)
+
+
+def apply_radial_tables(source, tables):
+    """用采样表对源区域做径向模糊, 返回 window 形状的数组
+
+    source 为 tables.box 对应的源区域像素。
+    """
+    source = np.asarray(source)
+    box_height, box_width = source.shape[:2]
+    channels = source.shape[2:]
+    integer = np.issubdtype(source.dtype, np.integer)
+    # 8/16位输入用uint32累加与定点倒数除法 (见 compute_uniform_blur)
+    fixed = _fixed_point_exact(len(tables.steps), source.dtype)
+    acc_dtype = np.uint32 if fixed else np.int64 if integer else np.float64
+
+    # 每个像素的各通道补齐到 1/2/4/8 字节, 作为一个整数字聚集, 比逐通道的二维索引快得多
+    bands = int(np.prod(channels, dtype=np.int64))
+    word = 1 << (bands * source.itemsize - 1).bit_length()
+    lanes = word // source.itemsize if word <= 8 else bands
+
+    # 源像素展平后在末尾追加一个全零哨兵
+    flat = np.zeros((box_height * box_width + 1, lanes), dtype=source.dtype)
+    flat[:-1, :bands] = source.reshape(-1, bands)
+    words = flat.view(f"u{word}").ravel() if word <= 8 else None
+
+    # 按输出像素分段累加, 每段的累加器 (不含补齐的通道) 在各步之间留在缓存中;
+    # 每一步是前缀区间上的一次聚集, 步数随段的位置递减
+    total = len(tables.order)
+    result = np.empty((total, bands), dtype=source.dtype)
+    acc = np.empty((min(total, RADIAL_CHUNK), bands), dtype=acc_dtype)
+    for start in range(0, total, RADIAL_CHUNK):
+        stop = min(start + RADIAL_CHUNK, total)
+        part = acc[:stop - start]
+        part.fill(0)
+        for index in tables.steps:
+            if len(index) <= start:
+                break
+            index = index[start:stop]
+            if words is not None:
+                part[:len(index)] += np.take(words, index).view(source.dtype).reshape(-1, lanes)[:, :bands]
+            else:
+                part[:len(index)] += flat[index, :bands]
+
+        counts = tables.counts[start:stop, np.newaxis]
+        if fixed:
+            _divide_fixed(part, _reciprocals(counts), result[start:stop])
+        elif integer:
+            result[start:stop] = part // counts
+        else:
+            result[start:stop] = part / counts
+
+    blurred = np.empty_like(result)
+    blurred[tables.order] = result
+    return blurred.reshape((-1,) + channels)
+
+
+def radial_blur_window(read, width, height, cx, cy, strength, window):
+    """对输出区域 window (left, upper, right, lower) 做径向模糊
+
+    read(box) 返回源图像 box 区域的像素, 只读取采样实际覆盖的区域。
+    返回 (窗口高, 窗口宽) 或 (窗口高, 窗口宽, 通道) 的数组。
+    """
+    tables = radial_blur_tables(width, height, cx, cy, strength, window)
+    source = read(tables.box)
+    left, upper, right, lower = window
+    blurred = apply_radial_tables(source, tables)
+    return blurred.reshape((lower - upper, right - left) + source.shape[2:])
+
+
+def compute_radial_blur(pixels, center=None, strength=0.02):
+    """对 (高, 宽) 或 (高, 宽, 通道) 数组做径向模糊, 保持原数据类型"""
+    pixels = np.asarray(pixels)
+    height, width = pixels.shape[:2]
+
+    # 设置模糊中心（默认图像中心）
+    if center is None:
+        center = (width // 2, height // 2)
+    cx, cy = center
+
+    def read(box):
+        left, upper, right, lower = box
+        return pixels[upper:lower, left:right]
+    return radial_blur_window(read, width, height, cx, cy, strength, (0, 0, width, height))
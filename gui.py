@@ -0,0 +1,784 @@
+"""图形界面 - 基于pygame的简易处理与生成工具"""
+import pygame
+import sys
+import numpy as np
+from PIL import Image
+import os
+import threading
+import tkinter as tk
+from tkinter import filedialog
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import ResultCache
+from noise import NoisePool, white_noise
+from pipeline import SourceImage
+from pyramid import Pyramid
+from processing import fbm_array
+
+# 后台处理时的分块边长, 用于报告进度和响应取消（结果与整幅处理相同）
+PROGRESS_TILE_SIZE = 256
+
+# 高斯模糊按钮使用的标准差（像素）
+GAUSSIAN_SIGMA = 8.0
+
+# 界面背景色
+BACKGROUND_COLOR = (30, 30, 40)
+
+# 处理中的帧率；空闲时阻塞等待事件，最长等待时间（毫秒）
+ACTIVE_FPS = 60
+IDLE_WAIT_MS = 500
+
+# 文本表面缓存的条目上限
+TEXT_CACHE_SIZE = 512
+
+# 原始图像与处理结果的预览框尺寸
+PREVIEW_SIZE = (250, 250)
+RESULT_PREVIEW_SIZE = (200, 200)
+
+# 灰度图像的调色板
+GRAY_PALETTE = [(i, i, i) for i in range(256)]
+
+def array_to_surface(pixels):
+    """把 ndarray 直接包装为Pygame表面（共享内存，不经过编码解码）"""
+    if pixels.dtype == np.uint16:
+        pixels = (pixels >> 8).astype(np.uint8)
+    elif pixels.dtype == bool:
+        pixels = pixels.astype(np.uint8) * 255
+    elif pixels.dtype != np.uint8:
+        pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    if pixels.ndim == 3 and pixels.shape[2] == 2:
+        pixels = pixels[..., 0]  # 灰度+透明度只预览灰度
+    pixels = np.ascontiguousarray(pixels)
+    
+    height, width = pixels.shape[:2]
+    if pixels.ndim == 2:
+        # 8位调色板表面配灰度调色板
+        surface = pygame.image.frombuffer(pixels, (width, height), "P")
+        surface.set_palette(GRAY_PALETTE)
+        return surface
+    return pygame.image.frombuffer(pixels, (width, height), "RGBA" if pixels.shape[2] == 4 else "RGB")
+
+def find_chinese_font():
+    """尝试查找系统中支持中文的字体"""
+    # 常见中文字体路径
+    font_paths = [
+        # Windows 系统字体
+        "C:/Windows/Fonts/simhei.ttf",  # 黑体
+        "C:/Windows/Fonts/simsun.ttc",  # 宋体
+        "C:/Windows/Fonts/msyh.ttc",    # 微软雅黑
+        "C:/Windows/Fonts/msyhbd.ttc",  # 微软雅黑粗体
+        
+        # macOS 系统字体
+        "/System/Library/Fonts/PingFang.ttc",  # 苹方
+        "/System/Library/Fonts/STHeiti Light.ttc",  # 华文黑体
+        "/System/Library/Fonts/STHeiti Medium.ttc",
+        
+        # Linux 系统字体
+        "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",  # 文泉驿微米黑
+        "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",    # 文泉驿正黑
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",  # Noto Sans CJK
+        
+        # 跨平台通用字体
+        "simhei.ttf",  # 尝试当前目录下的字体
+    ]
+    
+    for path in font_paths:
+        if os.path.exists(path):
+            return path
+    
+    # 如果找不到任何中文字体，尝试使用默认字体
+    try:
+        return pygame.font.get_default_font()
+    except:
+        return None
+
+class ImageProcessor:
+    def __init__(self):
+        pygame.init()
+        self.width, self.height = 1000, 850  # 增加高度以容纳新按钮
+        self.screen = pygame.display.set_mode((self.width, self.height))
+        pygame.display.set_caption("简易处理与生成")
+        
+        # 查找并加载中文字体
+        self.font_path = find_chinese_font()
+        self.font = None
+        self.small_font = None
+        
+        if self.font_path:
+            try:
+                # 加载中文字体
+                self.font = pygame.font.Font(self.font_path, 24)
+                self.small_font = pygame.font.Font(self.font_path, 18)
+                print(f"使用字体: {self.font_path}")
+            except Exception as e:
+                print(f"加载字体失败: {e}")
+                self.font = pygame.font.SysFont(None, 24)
+                self.small_font = pygame.font.SysFont(None, 18)
+        else:
+            print("警告：找不到中文字体，使用系统默认字体")
+            self.font = pygame.font.SysFont(None, 24)
+            self.small_font = pygame.font.SysFont(None, 18)
+        
+        # 状态变量
+        self.image_path = None
+        self.source = None  # 上传图像 (pipeline.SourceImage)，预览和各次处理共用一次解码
+        self.image_surface = None
+        self.result_surface = None  # 最近一次处理结果的预览
+        self.result_path = None
+        self.output_dir = "output"
+        self.status = "就绪 - 点击'上传图片'选择图像"
+        self.processing = False
+        self.process_type = ""
+        
+        # 界面绘制缓存：只重绘内容变化的区域
+        self.text_cache = {}    # (文本, 字体, 颜色) -> 文本表面
+        self.scaled_cache = {}  # (图像表面, 尺寸) -> 缩放后的表面
+        self.drawn_state = {}   # 区域名称 -> 上次绘制时的内容状态
+        self.full_redraw = True
+        
+        # 处理结果缓存（重复处理同一图片时直接复用）
+        self.cache = ResultCache(os.path.join(self.output_dir, ".cache"))
+        
+        # 后台处理任务（单线程执行，界面线程只轮询结果）
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.job = None
+        self.cancel_event = None
+        self.progress = None  # (已完成块数, 总块数)
+        
+        # 噪声图相关变量
+        self.noise_preview_images = []  # 存储预览的噪声图（最多显示4张）
+        self.noise_pool = NoisePool(256, 256)  # 参与分形布朗运动的全部噪声图层
+        self.noise_counter = 0  # 噪声图计数器
+        self.fbm_counter = 0    # 分形布朗运动计数器
+        
+        # 创建输出目录
+        os.makedirs(self.output_dir, exist_ok=True)
+        
+        # 按钮定义 - 第一行
+        self.buttons_row1 = [
+            {"id": "upload", "rect": pygame.Rect(50, 30, 150, 50), "text": "上传图片", "color": (70, 130, 180)},
+            {"id": "normal", "rect": pygame.Rect(220, 30, 150, 50), "text": "法向贴图", "color": (60, 179, 113)},
+            {"id": "blur", "rect": pygame.Rect(390, 30, 150, 50), "text": "均匀模糊", "color": (218, 165, 32)},
+            {"id": "radial", "rect": pygame.Rect(560, 30, 150, 50), "text": "径向模糊", "color": (205, 92, 92)},
+            {"id": "gaussian", "rect": pygame.Rect(730, 30, 150, 50), "text": "高斯模糊", "color": (200, 140, 60)},
+        ]
+        
+        # 按钮定义 - 第二行（新功能）
+        self.buttons_row2 = [
+            {"id": "noise", "rect": pygame.Rect(50, 100, 150, 50), "text": "生成噪声图", "color": (100, 150, 200)},
+            {"id": "fbm", "rect": pygame.Rect(220, 100, 150, 50), "text": "分形布朗运动", "color": (150, 100, 200)},
+            {"id": "cancel", "rect": pygame.Rect(390, 100, 150, 50), "text": "取消处理", "color": (120, 120, 120)},
+        ]
+        
+        # 按钮定义 - 清除按钮（底部右侧）
+        self.clear_buttons = [
+            {"id": "clear_original", "rect": pygame.Rect(600, 750, 120, 40), "text": "清除预览", "color": (200, 100, 100)},
+            {"id": "clear_noise", "rect": pygame.Rect(730, 750, 120, 40), "text": "清除噪音预览", "color": (200, 100, 100)},
+            {"id": "clear_all", "rect": pygame.Rect(860, 750, 120, 40), "text": "全部清除", "color": (200, 100, 100)},
+        ]
+        
+        # 合并所有按钮
+        self.all_buttons = self.buttons_row1 + self.buttons_row2 + self.clear_buttons
+    
+    def open_file_dialog(self):
+        """打开文件对话框让用户选择图像"""
+        try:
+            # 初始化Tkinter
+            root = tk.Tk()
+            root.withdraw()  # 隐藏主窗口
+            
+            # 设置文件类型
+            file_types = [
+                ("图片文件", "*.jpg;*.jpeg;*.png;*.bmp;*.tga;*.tif"),
+                ("所有文件", "*.*")
+            ]
+            
+            # 打开文件对话框
+            file_path = filedialog.askopenfilename(
+                title="选择图片",
+                filetypes=file_types
+            )
+            
+            # 销毁Tkinter窗口
+            root.destroy()
+            
+            return file_path
+        except Exception as e:
+            print(f"打开文件对话框失败: {e}")
+            return None
+    
+    def handle_events(self, events):
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.quit()
+            
+            if event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                # 窗口被遮挡后重新显示，需要整屏重绘
+                self.full_redraw = True
+            
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    # 处理中按ESC取消处理，否则退出
+                    if self.processing:
+                        self.cancel_processing()
+                    else:
+                        self.quit()
+            
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1 and self.processing:  # 处理中只响应取消按钮
+                    pos = pygame.mouse.get_pos()
+                    if self.buttons_row2[-1]["rect"].collidepoint(pos):
+                        self.cancel_processing()
+                elif event.button == 1:  # 左键点击且不在处理中
+                    pos = pygame.mouse.get_pos()
+                    
+                    # 检查按钮点击
+                    for button in self.all_buttons:
+                        if button["rect"].collidepoint(pos):
+                            if button["id"] == "upload":  # 上传图片
+                                self.upload_image()
+                            elif button["id"] == "normal":  # 法向贴图
+                                self.start_processing("normal")
+                            elif button["id"] == "blur":  # 均匀模糊
+                                self.start_processing("uniform_blur")
+                            elif button["id"] == "radial":  # 径向模糊
+                                self.start_processing("radial_blur")
+                            elif button["id"] == "gaussian":  # 高斯模糊
+                                self.start_processing("gaussian_blur")
+                            elif button["id"] == "noise":  # 生成噪声图
+                                self.generate_noise()
+                            elif button["id"] == "fbm":    # 分形布朗运动
+                                self.start_processing("fbm")
+                            elif button["id"] == "clear_original":  # 清除原始预览
+                                self.clear_original_preview()
+                            elif button["id"] == "clear_noise":    # 清除噪音预览
+                                self.clear_noise_preview()
+                            elif button["id"] == "clear_all":       # 全部清除
+                                self.clear_all_previews()
+    
+    def upload_image(self):
+        """让用户选择并上传图片"""
+        try:
+            # 打开文件对话框
+            file_path = self.open_file_dialog()
+            self.full_redraw = True  # 对话框可能遮挡过窗口
+            
+            if not file_path:
+                self.status = "未选择图片"
+                return
+            
+            # 验证文件是否存在
+            if not os.path.exists(file_path):
+                self.status = f"文件不存在: {file_path}"
+                return
+            
+            # 打开并解码预览（大JPEG只按预览大小解码），同时验证是否是图片文件
+            try:
+                source = SourceImage(file_path, PREVIEW_SIZE)
+            except Exception as e:
+                self.status = f"无效的图片文件: {str(e)}"
+                return
+            
+            self.image_path = file_path
+            self.source = source
+            self.status = f"已上传图片: {os.path.basename(self.image_path)}"
+            
+            # 预览数组直接转换为显示表面
+            try:
+                preview = source.preview
+                if preview.mode not in ("L", "I;16", "RGB", "RGBA"):
+                    preview = preview.convert("RGBA" if "A" in preview.getbands() else "RGB")
+                self.image_surface = array_to_surface(np.asarray(preview))
+            except Exception as e:
+                self.status = f"加载图片错误: {str(e)}"
+                self.image_surface = None
+        except Exception as e:
+            self.status = f"上传错误: {str(e)}"
+    
+    def generate_noise(self):
+        """生成随机噪声图并添加到预览池"""
+        try:
+            # 生成噪声图
+            noise = white_noise(256, 256)
+            
+            # 保存噪声图
+            self.noise_counter += 1
+            noise_path = os.path.join(self.output_dir, f"noise_{self.noise_counter}.png")
+            Image.fromarray(noise, 'L').save(noise_path)
+            
+            # 数组直接作为预览表面
+            noise_surface = array_to_surface(noise)
+            self.noise_pool.add(noise)
+            
+            # 添加到预览池（最多4张）
+            if len(self.noise_preview_images) >= 4:
+                # 如果已经有4张，先清除所有预览图
+                self.noise_preview_images = []
+            
+            # 添加新噪声图
+            self.noise_preview_images.append({
+                "surface": noise_surface,
+                "path": noise_path
+            })
+            
+            self.status = f"已生成噪声图: noise_{self.noise_counter}.png"
+            return True
+        except Exception as e:
+            self.status = f"生成噪声图错误: {str(e)}"
+            return False
+    
+    def clear_original_preview(self):
+        """清除原始图像预览"""
+        self.image_path = None
+        self.source = None
+        self.image_surface = None
+        self.result_surface = None
+        self.result_path = None
+        self.status = "已清除原始图像预览"
+    
+    def clear_noise_preview(self):
+        """清除噪声预览池"""
+        self.noise_preview_images = []
+        self.noise_pool.clear()
+        self.status = "已清除噪声预览池"
+    
+    def clear_all_previews(self):
+        """清除所有预览"""
+        self.image_path = None
+        self.source = None
+        self.image_surface = None
+        self.result_surface = None
+        self.result_path = None
+        self.noise_preview_images = []
+        self.noise_pool.clear()
+        self.status = "已清除所有预览"
+    
+    def start_processing(self, process_type):
+        if process_type == "fbm":
+            # 特殊处理分形布朗运动
+            if not len(self.noise_pool):
+                self.status = "错误: 请先生成噪声图"
+                return
+        else:
+            # 其他处理需要上传的图片
+            if not self.image_path:
+                self.status = "错误: 请先上传图片"
+                return
+            
+            if not self.image_surface:
+                self.status = "错误: 图片加载失败，请重新上传"
+                return
+        
+        self.processing = True
+        self.process_type = process_type
+        self.status = f"正在处理{self.get_process_name(process_type)}..."
+        
+        # 提交到后台线程，界面循环继续运行
+        self.cancel_event = threading.Event()
+        self.progress = None
+        self.job = self.executor.submit(self.run_job, process_type)
+    
+    def cancel_processing(self):
+        """请求取消当前处理（在下一个分块开始前生效）"""
+        if self.processing and self.cancel_event:
+            self.cancel_event.set()
+            self.status = f"正在取消{self.get_process_name(self.process_type)}..."
+    
+    def report_progress(self, done, total):
+        """后台线程的进度回调"""
+        self.progress = (done, total)
+    
+    def quit(self):
+        """取消后台任务并退出程序"""
+        if self.cancel_event:
+            self.cancel_event.set()
+        self.executor.shutdown(wait=True)
+        pygame.quit()
+        sys.exit()
+    
+    def get_process_name(self, process_type):
+        names = {
+            "normal": "法向贴图",
+            "uniform_blur": "均匀模糊",
+            "gaussian_blur": "高斯模糊",
+            "radial_blur": "径向模糊",
+            "fbm": "分形布朗运动"
+        }
+        return names.get(process_type, "处理")
+    
+    def run_job(self, process_type):
+        """在后台线程中执行处理，返回 (是否成功, 输出路径, 结果数组)
+        
+        结果数组直接用于预览，不再从保存的文件读回。
+        """
+        options = {"tile_size": PROGRESS_TILE_SIZE, "progress": self.report_progress,
+                   "cancel": self.cancel_event}
+        
+        if process_type == "fbm":
+            # 分形布朗运动
+            self.fbm_counter += 1
+            output_path = os.path.join(self.output_dir, f"fbm_{self.fbm_counter}.png")
+            
+            # 噪声池中的全部图层（不受预览张数限制）
+            result = fbm_array(self.noise_pool.array)
+            Image.fromarray(result, 'L').save(output_path)
+            return True, output_path, result
+        
+        # 创建输出文件名
+        suffixes = {"normal": "normal", "uniform_blur": "blur", "gaussian_blur": "gaussian",
+                    "radial_blur": "radial"}
+        if process_type not in suffixes:
+            return False, None, None
+        file_name = os.path.basename(self.image_path)
+        file_base, file_ext = os.path.splitext(file_name)
+        output_path = os.path.join(self.output_dir, f"{file_base}_{suffixes[process_type]}{file_ext}")
+        
+        # 完整分辨率在第一次处理时解码，之后的处理直接复用
+        pipeline = self.source.pipeline(self.cache)
+        if process_type == "normal":
+            pipeline.normal_map()
+        elif process_type == "uniform_blur":
+            pipeline.uniform_blur(5)
+        elif process_type == "gaussian_blur":
+            pipeline.gaussian_blur(GAUSSIAN_SIGMA)
+        else:
+            pipeline.radial_blur(strength=0.03)
+            # 径向模糊不强制分块: 整幅计算才能复用缓存的整幅采样表 (进度只在完成时更新)
+            options.pop("tile_size")
+        pipeline.save(output_path, **options)
+        return True, output_path, pipeline.array
+    
+    def do_processing(self):
+        """轮询后台任务：更新进度，完成后收尾"""
+        if not self.processing or not self.job:
+            return
+        
+        if not self.job.done():
+            if self.progress and not self.cancel_event.is_set():
+                done, total = self.progress
+                self.status = f"正在处理{self.get_process_name(self.process_type)}... {done}/{total} 块"
+            return
+        
+        try:
+            success, output_path, result = self.job.result()
+        except Exception as e:
+            # 取消也以异常结束（tiling.ProcessingCancelled），下面按取消处理
+            if not self.cancel_event.is_set():
+                print(f"处理错误: {e}")
+            success, output_path, result = False, None, None
+        
+        if success and result is not None:
+            try:
+                if self.process_type == "fbm":
+                    # 结果数组直接转换为Pygame表面
+                    surface = array_to_surface(result)
+                    self.noise_pool.add(result)
+                    
+                    # 添加到预览池（最多4张）
+                    if len(self.noise_preview_images) >= 4:
+                        # 如果已经有4张，先清除所有预览图
+                        self.noise_preview_images = []
+                    
+                    # 添加新生成的FBM图像
+                    self.noise_preview_images.append({
+                        "surface": surface,
+                        "path": output_path
+                    })
+                else:
+                    # 预览取金字塔中不小于预览框的最小一级，不保留整幅结果的表面
+                    _, preview = Pyramid(result).level_for(RESULT_PREVIEW_SIZE)
+                    self.result_surface = array_to_surface(preview)
+                    self.result_path = output_path
+            except Exception as e:
+                print(f"加载结果预览错误: {e}")
+                success = False
+        
+        if self.cancel_event.is_set() and not success:
+            self.status = f"{self.get_process_name(self.process_type)}已取消"
+        elif success:
+            self.status = f"{self.get_process_name(self.process_type)}已保存至: {os.path.basename(output_path)}"
+        else:
+            self.status = f"{self.get_process_name(self.process_type)}处理失败"
+        
+        self.processing = False
+        self.process_type = ""
+        self.job = None
+        self.progress = None
+    
+    def render_text(self, text, font, color):
+        """渲染文本表面，按 (文本, 字体, 颜色) 缓存"""
+        key = (text, font, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) >= TEXT_CACHE_SIZE:
+                # 状态文字（如进度）不断变化，缓存满时整体清空
+                self.text_cache.clear()
+            surface = font.render(text, True, color)
+            self.text_cache[key] = surface
+        return surface
+    
+    def draw_text(self, text, font, color, x, y, centered=False):
+        """安全绘制文本的方法"""
+        try:
+            if not font:
+                # 如果字体未加载，使用默认字体
+                font = self.font = pygame.font.SysFont(None, 24)
+            
+            text_surface = self.render_text(text, font, color)
+            if centered:
+                text_rect = text_surface.get_rect(center=(x, y))
+                self.screen.blit(text_surface, text_rect)
+            else:
+                self.screen.blit(text_surface, (x, y))
+        except Exception as e:
+            print(f"绘制文本错误: {e}")
+            # 在错误位置绘制一个红色矩形作为错误指示
+            pygame.draw.rect(self.screen, (255, 0, 0), (x, y, 200, 30))
+    
+    def scaled(self, surface, size):
+        """缩放后的预览表面，同一图像只缩放一次"""
+        key = (surface, size)
+        scaled = self.scaled_cache.get(key)
+        if scaled is None:
+            scaled = pygame.transform.scale(surface, size)
+            self.scaled_cache[key] = scaled
+        return scaled
+    
+    def sections(self):
+        """界面区域: (名称, 矩形, 内容状态, 绘制方法)，状态不变的区域无需重绘"""
+        noise_items = tuple((noise["surface"], noise["path"]) for noise in self.noise_preview_images)
+        return [
+            ("buttons", pygame.Rect(0, 0, self.width, 162), self.processing, self.draw_buttons),
+            ("status", pygame.Rect(0, 162, 585, 48), self.status, self.draw_status),
+            ("instructions", pygame.Rect(0, 210, 585, 305), None, self.draw_instructions),
+            ("original", pygame.Rect(585, 132, 280, 300), self.image_surface, self.draw_original_preview),
+            ("result", pygame.Rect(310, 508, 240, 275), (self.result_surface, self.result_path),
+             self.draw_result_preview),
+            ("noise", pygame.Rect(560, 412, 320, 308), (noise_items, len(self.noise_pool)),
+             self.draw_noise_preview),
+            ("footer", pygame.Rect(0, 745, self.width, self.height - 745), None, self.draw_footer),
+        ]
+    
+    def draw_ui(self):
+        """只重绘内容有变化的区域，并只把这些区域更新到屏幕"""
+        sections = self.sections()
+        dirty = {name for name, _, state, _ in sections
+                 if self.full_redraw or self.drawn_state.get(name, self.drawn_state) != state}
+        if not dirty:
+            return
+        
+        # 与重绘区域重叠的区域也要重画（清空背景会擦掉它们的一部分）
+        changed = True
+        while changed:
+            changed = False
+            dirty_rects = [rect for name, rect, _, _ in sections if name in dirty]
+            for name, rect, _, _ in sections:
+                if name not in dirty and rect.collidelist(dirty_rects) != -1:
+                    dirty.add(name)
+                    changed = True
+        
+        # 先清空所有待重绘区域，再按顺序绘制，每个区域只画在自己的矩形内
+        if self.full_redraw:
+            self.screen.fill(BACKGROUND_COLOR)
+        rects = []
+        for name, rect, _, _ in sections:
+            if name in dirty:
+                self.screen.fill(BACKGROUND_COLOR, rect)
+                rects.append(rect)
+        for name, rect, state, draw in sections:
+            if name in dirty:
+                self.screen.set_clip(rect)
+                draw()
+                self.drawn_state[name] = state
+        self.screen.set_clip(None)
+        
+        # 丢弃已不再显示的图像的缩放缓存
+        live = {self.image_surface, self.result_surface}
+        live.update(noise["surface"] for noise in self.noise_preview_images)
+        self.scaled_cache = {key: value for key, value in self.scaled_cache.items() if key[0] in live}
+        
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_redraw = False
+        else:
+            pygame.display.update(rects)
+    
+    def draw_buttons(self):
+        """两行功能按钮与分隔线"""
+        # 绘制第一行按钮
+        for button in self.buttons_row1:
+            color = button["color"]
+            if self.processing:
+                # 处理中时按钮变暗
+                color = tuple(max(0, c - 80) for c in color)
+            
+            pygame.draw.rect(self.screen, color, button["rect"], border_radius=10)
+            pygame.draw.rect(self.screen, (200, 200, 200), button["rect"], 2, border_radius=10)
+            
+            # 绘制按钮文本
+            self.draw_text(button["text"], self.font, (255, 255, 255), 
+                          button["rect"].centerx, button["rect"].centery, centered=True)
+        
+        # 绘制第二行按钮
+        for button in self.buttons_row2:
+            color = button["color"]
+            if button["id"] == "cancel":
+                # 取消按钮只在处理中可用
+                if self.processing:
+                    color = (220, 120, 60)
+                else:
+                    color = tuple(max(0, c - 80) for c in color)
+            elif self.processing:
+                # 处理中时按钮变暗
+                color = tuple(max(0, c - 80) for c in color)
+            
+            pygame.draw.rect(self.screen, color, button["rect"], border_radius=10)
+            pygame.draw.rect(self.screen, (200, 200, 200), button["rect"], 2, border_radius=10)
+            
+            # 绘制按钮文本
+            self.draw_text(button["text"], self.font, (255, 255, 255), 
+                          button["rect"].centerx, button["rect"].centery, centered=True)
+        
+        # 绘制分隔线
+        pygame.draw.line(self.screen, (100, 100, 150), (0, 90), (self.width, 90), 2)
+        pygame.draw.line(self.screen, (100, 100, 150), (0, 160), (self.width, 160), 2)
+    
+    def draw_status(self):
+        """状态信息"""
+        self.draw_text(self.status, self.font, (220, 220, 100), 50, 170)
+    
+    def draw_instructions(self):
+        """使用说明"""
+        instructions = [
+            "使用说明:",
+            "1. 点击'上传图片'按钮选择图片",
+            "2. 点击'法向贴图'生成法向贴图",
+            "3. 点击'均匀模糊'或'高斯模糊'模糊图像",
+            "4. 点击'径向模糊'应用径向模糊",
+            "5. 点击'生成噪声图'创建随机噪声",
+            "6. 点击'分形布朗运动'叠加噪声图",
+            "7. 使用底部按钮清除预览内容",
+            "8. 处理中按ESC或'取消处理'可中止",
+            "处理结果保存在output目录中"
+        ]
+        
+        for i, text in enumerate(instructions):
+            self.draw_text(text, self.small_font, (180, 180, 255), 50, 220 + i * 30)
+    
+    def draw_original_preview(self):
+        """原始图像预览"""
+        preview_x = 600
+        preview_y = 170  # 下移预览区，避免覆盖按钮
+        preview_size = (250, 250)  # 缩小预览框尺寸
+        
+        if self.image_surface:
+            # 调整图像大小以适应预览区域
+            scaled_img = self.scaled(self.image_surface, preview_size)
+            self.screen.blit(scaled_img, (preview_x, preview_y))
+        else:
+            # 如果没有图片，显示提示信息
+            self.draw_text("无原始图像", self.small_font, (150, 150, 200), 
+                          preview_x + preview_size[0] // 2, preview_y + preview_size[1] // 2, centered=True)
+        
+        # 绘制预览框
+        pygame.draw.rect(self.screen, (100, 100, 150), 
+                        (preview_x - 10, preview_y - 10, 
+                         preview_size[0] + 20, preview_size[1] + 20), 2, border_radius=8)
+        
+        # 绘制预览标题
+        self.draw_text("原始图像预览", self.small_font, (200, 200, 200), 
+                      preview_x + preview_size[0] // 2, preview_y - 25, centered=True)
+    
+    def draw_result_preview(self):
+        """处理结果预览"""
+        result_x = 330
+        result_y = 545
+        result_size = RESULT_PREVIEW_SIZE
+        
+        if self.result_surface:
+            scaled_result = self.scaled(self.result_surface, result_size)
+            self.screen.blit(scaled_result, (result_x, result_y))
+            self.draw_text(os.path.basename(self.result_path), self.small_font, (220, 220, 100), 
+                          result_x + result_size[0] // 2, result_y + result_size[1] + 25, centered=True)
+        else:
+            self.draw_text("无处理结果", self.small_font, (150, 150, 200), 
+                          result_x + result_size[0] // 2, result_y + result_size[1] // 2, centered=True)
+        
+        pygame.draw.rect(self.screen, (100, 100, 150), 
+                        (result_x - 10, result_y - 10, 
+                         result_size[0] + 20, result_size[1] + 20), 2, border_radius=8)
+        self.draw_text("处理结果预览", self.small_font, (200, 200, 200), 
+                      result_x + result_size[0] // 2, result_y - 25, centered=True)
+    
+    def draw_noise_preview(self):
+        """噪声图预览池"""
+        noise_preview_x = 600
+        noise_preview_y = 450  # 下移噪声预览区
+        noise_preview_size = 120  # 每个预览小图的大小
+        
+        # 绘制预览框
+        pygame.draw.rect(self.screen, (100, 100, 150), 
+                        (noise_preview_x - 10, noise_preview_y - 10, 
+                         noise_preview_size * 2 + 20, noise_preview_size * 2 + 20), 2, border_radius=8)
+        
+        # 绘制预览标题
+        self.draw_text(f"噪声图预览池 (最多显示4张, 共{len(self.noise_pool)}层)", self.small_font, (200, 200, 200), 
+                      noise_preview_x + noise_preview_size, noise_preview_y - 25, centered=True)
+        
+        # 绘制噪声图预览
+        for i, noise in enumerate(self.noise_preview_images):
+            row = i // 2
+            col = i % 2
+            x = noise_preview_x + col * noise_preview_size
+            y = noise_preview_y + row * noise_preview_size
+            
+            # 调整图像大小以适应预览区域
+            scaled_noise = self.scaled(noise["surface"], (noise_preview_size, noise_preview_size))
+            self.screen.blit(scaled_noise, (x, y))
+            
+            # 绘制文件名
+            file_name = os.path.basename(noise["path"])
+            self.draw_text(file_name, self.small_font, (220, 220, 100), 
+                          x + noise_preview_size // 2, y + noise_preview_size + 15, centered=True)
+        
+        # 如果没有噪声图，显示提示
+        if not self.noise_preview_images:
+            self.draw_text("无噪声图", self.small_font, (150, 150, 200), 
+                          noise_preview_x + noise_preview_size, noise_preview_y + noise_preview_size, centered=True)
+    
+    def draw_footer(self):
+        """清除按钮与底部信息"""
+        # 绘制清除按钮
+        for button in self.clear_buttons:
+            pygame.draw.rect(self.screen, button["color"], button["rect"], border_radius=8)
+            pygame.draw.rect(self.screen, (200, 200, 200), button["rect"], 2, border_radius=8)
+            
+            # 使用小字体绘制按钮文本
+            self.draw_text(button["text"], self.small_font, (255, 255, 255), 
+                          button["rect"].centerx, button["rect"].centery, centered=True)
+        
+        # 绘制底部信息
+        self.draw_text("简易处理与生成 v1.0 by chuyueyu | 按ESC退出", self.small_font, (150, 150, 200), 
+                      self.width // 2, self.height - 50, centered=True)
+    
+    def run(self):
+        clock = pygame.time.Clock()
+        
+        while True:
+            if self.processing:
+                # 处理中需要持续轮询后台任务和刷新进度
+                self.handle_events(pygame.event.get())
+                self.do_processing()
+                clock.tick(ACTIVE_FPS)
+            else:
+                # 空闲时阻塞等待事件，不再空转
+                event = pygame.event.wait(IDLE_WAIT_MS)
+                events = [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+                self.handle_events(events)
+            
+            self.draw_ui()
+
+
+if __name__ == "__main__":
+    app = ImageProcessor()
+    app.run()
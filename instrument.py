@@ -0,0 +1,223 @@
+"""处理过程计时 - 可选开启, 记录每次调用各阶段 (解码、计算、编码、写文件) 的耗时与数据量
+
+    with instrument.recording(memory=True) as recorder:
+        generate_normal_map("a.png", "output/a_normal.png")
+    print(recorder.summary())
+    recorder.write_chrome_trace("trace.json")   # 可在 chrome://tracing 或 Perfetto 中打开
+
+未开启时 span() 直接返回一个共用的空上下文, 几乎没有额外开销。
+memory=True 时用 tracemalloc 统计各阶段的峰值内存 (只包括经Python/NumPy分配的内存,
+PIL内部的图像缓冲区不计在内)。
+"""
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# 当前记录器, 为 None 时不记录
+_recorder = None
+
+
+def span(name, **args):
+    """记录一个阶段, 返回上下文管理器; 可在 with 块内向得到的字典补充参数
+
+    不记录时得到的是每次新建的空字典 (多线程同时使用互不影响), 补充参数前需要额外
+    开销 (如读取文件大小) 的调用方应先检查 enabled()。
+    """
+    if _recorder is None:
+        return contextlib.nullcontext({})
+    return _recorder.span(name, args)
+
+
+def enabled():
+    return _recorder is not None
+
+
+def enable(memory=False):
+    """开始记录, 返回记录器"""
+    global _recorder
+    _recorder = Recorder(memory)
+    return _recorder
+
+
+def disable():
+    """停止记录, 返回之前的记录器"""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+    return recorder
+
+
+@contextlib.contextmanager
+def recording(memory=False):
+    """在 with 块内记录"""
+    recorder = enable(memory)
+    try:
+        yield recorder
+    finally:
+        disable()
+
+
+class TimedFile:
+    """包装写入的文件对象, 统计写文件本身的耗时与字节数 (与编码分开)"""
+
+    def __init__(self, file):
+        self.file = file
+        self.name = file.name  # PIL 根据文件名判断保存格式
+        self.write_seconds = 0.0
+        self.bytes_written = 0
+
+    def write(self, data):
+        start = time.perf_counter()
+        count = self.file.write(data)
+        self.write_seconds += time.perf_counter() - start
+        self.bytes_written += len(data)
+        return count
+
+    def fileno(self):
+        # 不提供文件描述符, 让编码器都经由 write() 写入
+        raise io.UnsupportedOperation("fileno")
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def save_image(image, output_path, **params):
+    """保存PIL图像 (params 为编码参数); 记录时把编码与写文件分开计时"""
+    if _recorder is None:
+        image.save(output_path, **params)
+        return
+    with span("encode", path=output_path) as args:
+        with open(output_path, "wb") as file:
+            timed = TimedFile(file)
+            image.save(timed, **params)
+        args["bytes_written"] = timed.bytes_written
+        args["write_ms"] = timed.write_seconds * 1000
+
+
+class Recorder:
+    """收集阶段事件; 时间戳取自单调时钟 (纳秒), 不同进程的事件可以合并"""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        else:
+            self.started_tracing = False
+
+    def close(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    @contextlib.contextmanager
+    def span(self, name, args):
+        # 嵌套阶段的峰值内存: 进入时重置峰值, 退出时把本阶段峰值并入外层
+        peaks = getattr(self.local, "peaks", None)
+        if peaks is None:
+            peaks = self.local.peaks = []
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+            tracemalloc.reset_peak()
+            peaks.append(0)
+
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        except BaseException as error:
+            args["error"] = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            if self.memory:
+                peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if peaks:
+                    peaks[-1] = max(peaks[-1], peak)
+                args["peak_bytes"] = peak
+            event = {"name": name, "start_ns": start, "duration_ns": end - start,
+                     "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+            with self.lock:
+                self.events.append(event)
+
+    def extend(self, events):
+        """并入其它进程记录的事件"""
+        with self.lock:
+            self.events.extend(events)
+
+    def write_chrome_trace(self, path):
+        """写出 Chrome trace 格式 (完整事件, 时间单位为微秒)"""
+        origin = min((event["start_ns"] for event in self.events), default=0)
+        trace = [{"name": event["name"], "ph": "X", "pid": event["pid"], "tid": event["tid"],
+                  "ts": (event["start_ns"] - origin) / 1000, "dur": event["duration_ns"] / 1000,
+                  "args": event["args"]} for event in self.events]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file, ensure_ascii=False,
+                      default=str)
+
+    def write_event_log(self, path):
+        """写出JSON事件日志, 每行一个事件"""
+        with open(path, "w", encoding="utf-8") as file:
+            for event in sorted(self.events, key=lambda event: event["start_ns"]):
+                file.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def write(self, path):
+        """按扩展名写出: .jsonl 为事件日志, 其它为 Chrome trace"""
+        if path.lower().endswith(".jsonl"):
+            self.write_event_log(path)
+        else:
+            self.write_chrome_trace(path)
+
+    def totals(self):
+        """按阶段名汇总: 名称 -> {次数, 总耗时, 最长耗时, 读写字节, 峰值内存, 错误数}
+
+        encode 事件中写文件的耗时单独列为 write 阶段。
+        """
+        totals = {}
+
+        def add(name, seconds, args):
+            item = totals.setdefault(name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                            "bytes_read": 0, "bytes_written": 0,
+                                            "peak_bytes": None, "errors": 0})
+            item["count"] += 1
+            item["seconds"] += seconds
+            item["max_seconds"] = max(item["max_seconds"], seconds)
+            item["bytes_read"] += args.get("bytes_read", 0)
+            item["bytes_written"] += args.get("bytes_written", 0)
+            if "peak_bytes" in args:
+                item["peak_bytes"] = max(item["peak_bytes"] or 0, args["peak_bytes"])
+            item["errors"] += "error" in args
+
+        for event in self.events:
+            args = event["args"]
+            seconds = event["duration_ns"] / 1e9
+            if "write_ms" in args:
+                write_seconds = args["write_ms"] / 1000
+                add(event["name"], seconds - write_seconds, {key: value for key, value in args.items()
+                                                             if key != "bytes_written"})
+                add("write", write_seconds, {"bytes_written": args["bytes_written"]})
+            else:
+                add(event["name"], seconds, args)
+        return totals
+
+    def summary(self):
+        """各阶段汇总表 (文本)"""
+        lines = [f"{'阶段':<24}{'次数':>6}{'总耗时ms':>12}{'最长ms':>10}{'读取MB':>10}{'写入MB':>10}{'峰值MB':>10}"]
+        for name, item in sorted(self.totals().items(), key=lambda pair: -pair[1]["seconds"]):
+            peak = "-" if item["peak_bytes"] is None else f"{item['peak_bytes'] / 1e6:.1f}"
+            line = (f"{name:<24}{item['count']:>6}{item['seconds'] * 1000:>12.1f}"
+                    f"{item['max_seconds'] * 1000:>10.1f}{item['bytes_read'] / 1e6:>10.1f}"
+                    f"{item['bytes_written'] / 1e6:>10.1f}{peak:>10}")
+            if item["errors"]:
+                line += f"  错误 {item['errors']}"
+            lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,157 @@
+"""处理服务压测 - 并发发送请求, 统计延迟分位数 (p50/p90/p99) 与吞吐量
+
+用法:
+    python server.py --workers 4 &
+    python loadtest.py --op blur --size 512 --concurrency 16 --requests 400
+    python loadtest.py --op normal --params strength=3 --unix-socket /tmp/imgproc.sock
+
+测试图像在本地合成, 不需要样例图片。结束时同时打印服务端 /metrics 中的批处理统计。
+"""
+import argparse
+import http.client
+import io
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+from PIL import Image
+
+from server import DEFAULT_PORT, OPERATIONS
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """经Unix套接字发送的HTTP连接"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def synthetic_png(size, mode, seed=0):
+    """合成测试图像 (平滑渐变加噪声), 返回PNG字节"""
+    rng = np.random.default_rng(seed)
+    channels = len(mode)
+    ramp = np.add.outer(np.arange(size), np.arange(size)) * (255.0 / (2 * size))
+    pixels = ramp[..., np.newaxis] + rng.normal(0, 20, (size, size, channels))
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels[..., 0] if channels == 1 else pixels, mode).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_load(connect, method, path, body, concurrency, total):
+    """用 concurrency 个线程 (各自一条长连接) 共发送 total 个请求
+
+    返回 ({状态码: 次数}, 成功请求的延迟列表(秒), 总耗时)
+    """
+    lock = threading.Lock()
+    remaining = [total]
+    latencies = []
+    statuses = {}
+
+    def worker():
+        connection = connect()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=body)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                if response.getheader("Connection", "").lower() == "close":
+                    connection.close()
+                    connection = connect()
+            except (OSError, http.client.HTTPException):
+                status = "连接错误"
+                connection.close()
+                connection = connect()
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses, latencies, time.perf_counter() - start
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="loadtest.py", description="处理服务压测")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", default=None, help="经Unix套接字连接")
+    parser.add_argument("--op", choices=sorted(OPERATIONS) + ["noise"], default="blur", help="要测试的操作")
+    parser.add_argument("--params", nargs="*", default=[], metavar="名称=值",
+                        help="操作参数, 如 radius=8 (noise 时为 width=512 等)")
+    parser.add_argument("--size", type=int, default=512, help="测试图像边长")
+    parser.add_argument("--mode", choices=["L", "RGB", "RGBA"], default="RGB", help="测试图像模式")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发连接数")
+    parser.add_argument("--requests", type=int, default=200, help="请求总数")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时 (秒)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def connect():
+        if args.unix_socket:
+            return UnixHTTPConnection(args.unix_socket, timeout=args.timeout)
+        return http.client.HTTPConnection(args.host, args.port, timeout=args.timeout)
+
+    query = urlencode(dict(item.split("=", 1) for item in args.params))
+    path = f"/{args.op}" + (f"?{query}" if query else "")
+    if args.op == "noise":
+        method, body = "GET", None
+    else:
+        method, body = "POST", synthetic_png(args.size, args.mode)
+
+    print(f"{method} {path}: {args.requests} 个请求, 并发 {args.concurrency}")
+    statuses, latencies, elapsed = run_load(connect, method, path, body, args.concurrency, args.requests)
+
+    latencies_ms = [latency * 1000 for latency in latencies]
+    print(f"状态: {statuses}")
+    print(f"吞吐量: {len(latencies) / elapsed:.1f} 请求/秒 (用时 {elapsed:.2f}s)")
+    if latencies_ms:
+        print(f"延迟ms: p50 {percentile(latencies_ms, 50):.1f}  p90 {percentile(latencies_ms, 90):.1f}  "
+              f"p99 {percentile(latencies_ms, 99):.1f}  max {max(latencies_ms):.1f}  "
+              f"平均 {statistics.fmean(latencies_ms):.1f}")
+
+    connection = connect()
+    try:
+        connection.request("GET", "/metrics")
+        metrics = json.loads(connection.getresponse().read())
+        print(f"服务端批处理: {metrics['batches']}, 拒绝 {metrics['rejected']}")
+    except (OSError, ValueError, http.client.HTTPException) as error:
+        print(f"读取服务端统计失败: {error}")
+    finally:
+        connection.close()
+    return 0 if statuses.get(200, 0) == args.requests else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""相干噪声 - 向量化的梯度 (Perlin) 噪声与值噪声, 以及一次生成的多倍频分形噪声
+
+所有倍频在同一组像素坐标上计算: 每个倍频只把一维坐标乘以各自的频率,
+二维部分只剩查表与插值, 不需要生成和混合多张图片。
+
+另有按种子批量生成的白噪声: 第 i 张图使用 SeedSequence(seed).spawn 的第 i 个子序列,
+任何一张都能由 (种子, 序号) 单独重新生成。
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+NOISE_KINDS = ("perlin", "value")
+
+# 8个单位梯度方向
+_ANGLES = np.arange(8) * (np.pi / 4)
+GRADIENTS = np.stack([np.cos(_ANGLES), np.sin(_ANGLES)], axis=1).astype(np.float32)
+
+# 单位梯度的二维Perlin噪声取值范围为 [-sqrt(1/2), sqrt(1/2)]
+PERLIN_RANGE = np.float32(np.sqrt(0.5))
+
+
+def _fade(t):
+    """五次平滑曲线 6t^5 - 15t^4 + 10t^3"""
+    return t * t * t * (t * (t * np.float32(6) - np.float32(15)) + np.float32(10))
+
+
+def _axis(size, frequency, period):
+    """一维格点数据: (左格点, 右格点, 小数部分)
+
+    period 不为 None 时格点坐标按周期取模, 使噪声可以无缝平铺。
+    """
+    position = np.arange(size, dtype=np.float64) * frequency
+    cell = np.floor(position).astype(np.int64)
+    fraction = (position - cell).astype(np.float32)
+    if period is None:
+        return cell & 255, (cell + 1) & 255, fraction
+    return (cell % period) & 255, ((cell + 1) % period) & 255, fraction
+
+
+def _prepare_octave(rng, width, height, frequency, kind, tileable):
+    """准备一个倍频的查找表和一维坐标因子 (与行无关的部分只算一次)"""
+    # 每个倍频使用独立的排列表, 避免各层在原点处对齐
+    perm = rng.permutation(256)
+    table = np.concatenate([perm, perm])
+    if kind == "value":
+        tables = (rng.random(256, dtype=np.float32)[table],)
+    else:
+        gradient = GRADIENTS[table & 7]
+        tables = (np.ascontiguousarray(gradient[:, 0]), np.ascontiguousarray(gradient[:, 1]))
+
+    if tileable:
+        cells_x = max(1, round(width * frequency))
+        cells_y = max(1, round(height * frequency))
+        x0, x1, fx = _axis(width, cells_x / width, cells_x)
+        y0, y1, fy = _axis(height, cells_y / height, cells_y)
+    else:
+        x0, x1, fx = _axis(width, frequency, None)
+        y0, y1, fy = _axis(height, frequency, None)
+
+    # 角点哈希 perm[perm[x] + y]: x方向先查一次表, 与行相加即得二维索引
+    u = _fade(fx)
+    if kind == "value":
+        x_factors = (1 - u, u)
+    else:
+        x_factors = (fx * (1 - u), (fx - 1) * u, 1 - u, u)
+    return {
+        "tables": tables,
+        "columns": (table[x0].astype(np.intp), table[x1].astype(np.intp)),
+        "rows": (y0.astype(np.intp), y1.astype(np.intp)),
+        "fy": fy,
+        "v": _fade(fy),
+        "x_factors": x_factors,
+    }
+
+
+def _octave_rows(octave, upper, lower, kind):
+    """计算一个倍频在 [upper, lower) 行的取值
+
+    同一格子行内各行的角点哈希相同, 查表只对不同的格子行做一次,
+    逐像素的工作只剩按行展开与插值。
+    """
+    col0, col1 = octave["columns"]
+    rows0 = octave["rows"][0][upper:lower]
+    rows1 = octave["rows"][1][upper:lower]
+    keys, inverse = np.unique(rows0 * 512 + rows1, return_inverse=True)
+    row0 = (keys // 512)[:, np.newaxis]
+    row1 = (keys % 512)[:, np.newaxis]
+    v = octave["v"][upper:lower, np.newaxis]
+
+    if kind == "value":
+        values = octave["tables"][0]
+        wx0, wx1 = octave["x_factors"]
+        top = (values[row0 + col0] * wx0 + values[row0 + col1] * wx1)[inverse]
+        bottom = (values[row1 + col0] * wx0 + values[row1 + col1] * wx1)[inverse]
+    else:
+        # 双线性插值展开后, x方向的权重与距离合并为一维因子:
+        # top = gx00*fx*(1-u) + gx10*(fx-1)*u + fy*(gy00*(1-u) + gy10*u)
+        gx, gy = octave["tables"]
+        a, b, c, d = octave["x_factors"]
+        fy = octave["fy"][upper:lower, np.newaxis]
+        top = (gx[row0 + col0] * a + gx[row0 + col1] * b)[inverse]
+        top += (gy[row0 + col0] * c + gy[row0 + col1] * d)[inverse] * fy
+        bottom = (gx[row1 + col0] * a + gx[row1 + col1] * b)[inverse]
+        bottom += (gy[row1 + col0] * c + gy[row1 + col1] * d)[inverse] * (fy - 1)
+
+    bottom -= top
+    bottom *= v
+    top += bottom
+    return top
+
+
+# 分行带计算, 让每个倍频的临时数组留在CPU缓存里
+BAND_ROWS = 8
+
+
+def fbm_noise(width=256, height=256, octaves=5, lacunarity=2.0, gain=0.5, scale=64.0,
+              seed=None, kind="perlin", tileable=False):
+    """一次生成分形布朗运动噪声, 返回取值在 [0, 1] 的 (高, 宽) float32 数组
+
+    scale 为最低倍频一个格子的像素宽度, 每个倍频频率乘 lacunarity、振幅乘 gain。
+    tileable 为 True 时每个倍频的格子数取整, 图像左右、上下可以无缝拼接。
+    """
+    if kind not in NOISE_KINDS:
+        raise ValueError(f"未知的噪声类型: {kind}")
+    if octaves < 1:
+        raise ValueError("倍频数至少为1")
+
+    rng = np.random.default_rng(seed)
+    layers = []
+    amplitude = 1.0
+    frequency = 1.0 / scale
+    for _ in range(octaves):
+        layers.append((_prepare_octave(rng, width, height, frequency, kind, tileable),
+                       np.float32(amplitude)))
+        amplitude *= gain
+        frequency *= lacunarity
+    total_amplitude = sum(float(weight) for _, weight in layers)
+
+    result = np.empty((height, width), dtype=np.float32)
+    for upper in range(0, height, BAND_ROWS):
+        lower = min(upper + BAND_ROWS, height)
+        band = result[upper:lower]
+        band[...] = 0
+        for octave, weight in layers:
+            layer = _octave_rows(octave, upper, lower, kind)
+            layer *= weight
+            band += layer
+
+    result /= np.float32(total_amplitude)
+    if kind == "perlin":
+        result /= PERLIN_RANGE
+        result += np.float32(1)
+        result *= np.float32(0.5)
+    np.clip(result, 0, 1, out=result)
+    return result
+
+
+def coherent_noise(width=256, height=256, scale=64.0, seed=None, kind="perlin", tileable=False):
+    """单一倍频的相干噪声, 返回取值在 [0, 1] 的 (高, 宽) float32 数组"""
+    return fbm_noise(width, height, 1, scale=scale, seed=seed, kind=kind, tileable=tileable)
+
+
+# 每个线程至少分到的像素数, 小批量时线程调度的开销比生成本身还大
+MIN_THREAD_PIXELS = 1 << 20
+
+
+def _image_rng(seed, index):
+    """第 index 张图的随机数发生器, 等同于 SeedSequence(seed).spawn(...)[index]"""
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(index,))))
+
+
+def _fill_white(out, seed, start):
+    """用 start 起的各张图的发生器逐张就地填充 out"""
+    for offset, image in enumerate(out):
+        rng = _image_rng(seed, start + offset)
+        if image.dtype == np.uint8:
+            # 直接取发生器的64位原始输出按字节拆开, 每个字节都是均匀的 0-255
+            flat = image.reshape(-1)
+            raw = rng.bit_generator.random_raw(-(-flat.size // 8))
+            flat[...] = raw.view(np.uint8)[:flat.size]
+        else:
+            rng.random(out=image, dtype=np.float32)
+
+
+def white_noise_batch(count, width=256, height=256, seed=None, dtype=np.uint8, workers=None, out=None):
+    """批量生成白噪声, 返回 (count, 高, 宽) 数组
+
+    dtype 为 uint8 (0-255) 或 float32 ([0, 1)), 直接写入结果数组, 不经过其它类型转换。
+    seed 为 None 时每次结果不同; 给定 seed 时结果与线程数无关,
+    第 i 张与 white_noise(width, height, seed, i) 相同。
+    out 可传入预先分配好的数组 (如 np.lib.format.open_memmap 打开的 .npy 文件)。
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.uint8, np.float32):
+        raise ValueError(f"不支持的数据类型: {dtype}")
+    if out is None:
+        out = np.empty((count, height, width), dtype=dtype)
+    elif out.shape != (count, height, width) or out.dtype != dtype:
+        raise ValueError("输出数组的形状或数据类型不匹配")
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    # 按整张图分给各线程; 发生器在填充时释放GIL, 线程可以真正并行
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, count, count * width * height // MIN_THREAD_PIXELS))
+    edges = np.linspace(0, count, workers + 1).astype(int)
+    if workers == 1:
+        _fill_white(out, seed, 0)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_fill_white, out[start:stop], seed, start)
+                       for start, stop in zip(edges[:-1], edges[1:])]
+            for future in futures:
+                future.result()
+    return out
+
+
+def white_noise(width=256, height=256, seed=None, index=0, dtype=np.uint8):
+    """单张白噪声, 返回 (高, 宽) 数组; 与同一种子批量生成的第 index 张相同"""
+    out = np.empty((1, height, width), dtype=dtype)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    _fill_white(out, seed, index)
+    return out[0]
+
+
+class NoisePool:
+    """噪声图层池: 所有图层存放在一个连续的 (层数, 高, 宽) 数组中, 容量按需倍增"""
+
+    def __init__(self, width=None, height=None, dtype=np.uint8, capacity=8):
+        self.size = (width, height) if width and height else None
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.count = 0
+        self.buffer = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def array(self):
+        """已有图层的 (层数, 高, 宽) 视图"""
+        if self.buffer is None:
+            return np.empty((0,) + (self.size[::-1] if self.size else (0, 0)), dtype=self.dtype)
+        return self.buffer[:self.count]
+
+    def add(self, layer):
+        """加入一个图层 (PIL图像或二维数组), 尺寸不同时才缩放到池的尺寸"""
+        if isinstance(layer, Image.Image):
+            if layer.mode != 'L':
+                layer = layer.convert('L')
+            size = layer.size
+        else:
+            layer = np.asarray(layer)
+            size = layer.shape[1], layer.shape[0]
+        if self.size is None:
+            self.size = size
+        if size != self.size:
+            if not isinstance(layer, Image.Image):
+                layer = Image.fromarray(layer)
+            layer = layer.resize(self.size)
+
+        if self.buffer is None or self.count == len(self.buffer):
+            self._grow()
+        self.buffer[self.count] = np.asarray(layer)
+        self.count += 1
+
+    def _grow(self):
+        width, height = self.size
+        capacity = max(self.capacity, 2 * self.count)
+        buffer = np.empty((capacity, height, width), dtype=self.dtype)
+        if self.count:
+            buffer[:self.count] = self.buffer[:self.count]
+        self.buffer = buffer
+
+    def clear(self):
+        # 换用新数组而不是复用旧的, 后台任务持有的视图不会被新图层覆盖
+        self.buffer = None
+        self.count = 0
+
+
+def fbm_weights(count, gain=0.5):
+    """各层的归一化权重: 按 gain 指数衰减, 总和为1"""
+    weights = gain ** np.arange(count, dtype=np.float64)
+    return (weights / weights.sum()).astype(np.float32)
+
+
+def fbm_reduce(stack, gain=0.5):
+    """把 (层数, 高, 宽) 的图层叠加为一张 (高, 宽) float32 数组
+
+    float32 图层直接做一次 tensordot; 整数图层逐层累加,
+    类型转换共用一块临时数组, 层数再多也不会为每层分配内存。
+    """
+    stack = np.asarray(stack)
+    weights = fbm_weights(len(stack), gain)
+    if stack.dtype == np.float32:
+        return np.tensordot(weights, stack, axes=1)
+
+    result = np.zeros(stack.shape[1:], dtype=np.float32)
+    scratch = np.empty_like(result)
+    for layer, weight in zip(stack, weights):
+        np.multiply(layer, weight, out=scratch)
+        result += scratch
+    return result
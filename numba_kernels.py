@@ -0,0 +1,134 @@
+"""numba 后端的计算内核 - 按行并行 (prange) 的JIT编译循环, 需要安装 numba
+
+只由 backends 在选用 numba 后端时导入。编译结果缓存在 __pycache__ 中 (cache=True),
+第一次使用某种数据类型时编译一次, 之后的进程直接加载。
+结果与 engine 中的NumPy实现逐位相同: 浮点运算的顺序与之一致, 不启用 fastmath。
+
+并行循环默认使用 numba 的 workqueue 线程层: TBB/OpenMP 线程池启动后再fork
+(parallel.run_parallel 的进程池) 会使子进程卡住或中止; workqueue 可以fork, 但同一时间
+只能有一个线程调用并行内核。设置了环境变量 NUMBA_THREADING_LAYER 时以其为准。
+"""
+import math
+import os
+
+import numba
+import numpy as np
+
+from engine import compute_uniform_blur
+
+if "NUMBA_THREADING_LAYER" not in os.environ:
+    numba.config.THREADING_LAYER = "workqueue"
+
+# 盒式模糊竖直方向每个并行任务处理的列数
+COLUMN_BLOCK = 256
+
+
+@numba.njit(parallel=True, cache=True)
+def _radial_rows(source, source_left, source_upper, width, height, cx, cy, strength,
+                 left, upper, integer, out):
+    """逐个输出像素沿射线采样求平均, 采样规则与 engine.radial_blur_tables 相同"""
+    rows, cols, channels = out.shape
+    for row in numba.prange(rows):
+        acc = np.empty(channels, dtype=np.float64)
+        y = upper + row
+        for col in range(cols):
+            x = left + col
+            dx = x - cx
+            dy = y - cy
+            distance = np.sqrt(dx * dx + dy * dy)
+            samples = np.int64(distance * strength) + 1
+            if distance > 0:
+                dx /= distance
+                dy /= distance
+            acc[:] = 0.0
+            count = 0
+            for i in range(samples):
+                sample_x = np.int64(np.trunc(x - dx * i))
+                sample_y = np.int64(np.trunc(y - dy * i))
+                if 0 <= sample_x < width and 0 <= sample_y < height:
+                    count += 1
+                    for channel in range(channels):
+                        acc[channel] += source[sample_y - source_upper, sample_x - source_left, channel]
+            for channel in range(channels):
+                if integer:
+                    out[row, col, channel] = np.int64(acc[channel]) // count
+                else:
+                    out[row, col, channel] = acc[channel] / count
+
+
+def radial_blur_window(read, width, height, cx, cy, strength, window):
+    """同 engine.radial_blur_window, 不建立采样表, 读取的源区域为窗口向外扩展最长射线"""
+    left, upper, right, lower = window
+    # 最远的角点决定最长射线 (多留1像素给截断取整)
+    reach = max(math.hypot(x - cx, y - cy) for x in (left, right - 1) for y in (upper, lower - 1))
+    halo = int(reach * strength) + 1
+    box = (max(left - halo, 0), max(upper - halo, 0), min(right + halo, width), min(lower + halo, height))
+    source = np.asarray(read(box))
+    channels = source.shape[2:]
+    out = np.empty((lower - upper, right - left, int(np.prod(channels, dtype=np.int64))),
+                   dtype=source.dtype)
+    _radial_rows(np.ascontiguousarray(source).reshape(source.shape[:2] + (-1,)), box[0], box[1],
+                 width, height, float(cx), float(cy), float(strength), left, upper,
+                 bool(np.issubdtype(source.dtype, np.integer)), out)
+    return out.reshape((lower - upper, right - left) + channels)
+
+
+@numba.njit(parallel=True, cache=True)
+def _box_columns(source, radius, sums):
+    """竖直方向的滑动窗口和 (窗口在边界处收缩), source 与 sums 为 (高, 宽*通道)"""
+    height, width = source.shape
+    for block in numba.prange((width + COLUMN_BLOCK - 1) // COLUMN_BLOCK):
+        start = block * COLUMN_BLOCK
+        stop = min(start + COLUMN_BLOCK, width)
+        running = np.zeros(stop - start, dtype=sums.dtype)
+        for y in range(min(radius, height)):
+            for x in range(start, stop):
+                running[x - start] += source[y, x]
+        for y in range(height):
+            if y + radius < height:
+                for x in range(start, stop):
+                    running[x - start] += source[y + radius, x]
+            if y - radius - 1 >= 0:
+                for x in range(start, stop):
+                    running[x - start] -= source[y - radius - 1, x]
+            for x in range(start, stop):
+                sums[y, x] = running[x - start]
+
+
+@numba.njit(parallel=True, cache=True)
+def _box_rows(sums, radius, out):
+    """水平方向的滑动窗口和再按窗口大小整除, sums 与 out 为 (高, 宽, 通道)"""
+    height, width, channels = out.shape
+    for y in numba.prange(height):
+        count_y = min(y + radius + 1, height) - max(y - radius, 0)
+        running = np.zeros(channels, dtype=sums.dtype)
+        for x in range(min(radius, width)):
+            for channel in range(channels):
+                running[channel] += sums[y, x, channel]
+        for x in range(width):
+            if x + radius < width:
+                for channel in range(channels):
+                    running[channel] += sums[y, x + radius, channel]
+            if x - radius - 1 >= 0:
+                for channel in range(channels):
+                    running[channel] -= sums[y, x - radius - 1, channel]
+            count = count_y * (min(x + radius + 1, width) - max(x - radius, 0))
+            for channel in range(channels):
+                out[y, x, channel] = running[channel] // count
+
+
+def uniform_blur(pixels, radius=3):
+    """同 engine.compute_uniform_blur; 8/16位整数输入用滑动窗口求和, 其它类型使用NumPy实现"""
+    pixels = np.asarray(pixels)
+    if pixels.dtype not in (np.uint8, np.uint16) or radius <= 0:
+        return compute_uniform_blur(pixels, radius)
+    height, width = pixels.shape[:2]
+    window = min(2 * radius + 1, height) * min(2 * radius + 1, width)
+    acc_dtype = np.uint32 if window * int(np.iinfo(pixels.dtype).max) < 2 ** 32 else np.int64
+
+    source = np.ascontiguousarray(pixels).reshape(height, -1)
+    sums = np.empty(source.shape, dtype=acc_dtype)
+    _box_columns(source, radius, sums)
+    out = np.empty(pixels.shape, dtype=pixels.dtype)
+    _box_rows(sums.reshape(height, width, -1), radius, out.reshape(height, width, -1))
+    return out
@@ -0,0 +1,92 @@
+"""多进程处理单幅大图 - 输入输出放在共享内存中, 按行条带并行计算
+
+每个条带复用分块处理的带边缘计算 (见 tiling.py), 各条带的结果与单进程逐位相同。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backends import backend_name, limit_worker_threads
+from tiling import build_operation, make_reader
+
+# 每个工作进程平均分到的条带数, 多切几条以平衡径向模糊等不均匀的负载
+BANDS_PER_WORKER = 4
+MIN_BAND_ROWS = 16
+
+
+def _attach(name, shape, dtype):
+    """连接到已存在的共享内存块, 返回 (共享内存, 数组视图)"""
+    # 进程池的子进程与主进程共用资源跟踪器, 重复登记不会导致提前释放
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _compute_band(steps, source, output, upper, lower, backend=None):
+    """计算 [upper, lower) 行并写入输出数组"""
+    height, width = source.shape[:2]
+    operation = build_operation(steps, (width, height), backend)
+    read, size, _ = make_reader(source, operation.mode)
+    output[upper:lower] = operation.compute(read, size, (0, upper, width, lower))
+
+
+def _run_band(task):
+    """工作进程: 计算一个条带并直接写入共享输出"""
+    steps, source_spec, output_spec, upper, lower, backend = task
+    source_shm, source = _attach(*source_spec)
+    output_shm, output = _attach(*output_spec)
+    try:
+        _compute_band(steps, source, output, upper, lower, backend)
+    finally:
+        # 释放数组视图后才能关闭共享内存
+        del source, output
+        source_shm.close()
+        output_shm.close()
+    return lower - upper
+
+
+def output_layout(steps, pixels):
+    """处理结果的 (形状, 数据类型): 法向贴图输出RGB, 模糊保持输入格式"""
+    shape, dtype = pixels.shape, pixels.dtype
+    for name, _ in steps:
+        if name == "normal":
+            shape, dtype = pixels.shape[:2] + (3,), np.dtype(np.uint8)
+    return shape, dtype
+
+
+def run_parallel(pixels, steps, workers, backend=None):
+    """用 workers 个进程对整幅数组依次执行 steps ([(名称, 参数), ...]), 返回结果数组
+
+    backend 为计算后端名称 (见 backends.get_backend), 在主进程中解析后传给各工作进程。
+    """
+    pixels = np.asarray(pixels)
+    backend = backend_name(backend)
+    height = pixels.shape[0]
+    output_shape, output_dtype = output_layout(steps, pixels)
+
+    band_count = max(1, min(workers * BANDS_PER_WORKER, height // MIN_BAND_ROWS))
+    edges = np.linspace(0, height, band_count + 1).astype(int)
+
+    source_shm = shared_memory.SharedMemory(create=True, size=max(pixels.nbytes, 1))
+    output_shm = shared_memory.SharedMemory(
+        create=True, size=max(int(np.prod(output_shape)) * output_dtype.itemsize, 1))
+    try:
+        source = np.ndarray(pixels.shape, dtype=pixels.dtype, buffer=source_shm.buf)
+        source[...] = pixels
+        source_spec = (source_shm.name, pixels.shape, pixels.dtype.str)
+        output_spec = (output_shm.name, output_shape, output_dtype.str)
+        tasks = [(steps, source_spec, output_spec, int(upper), int(lower), backend)
+                 for upper, lower in zip(edges[:-1], edges[1:]) if lower > upper]
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=limit_worker_threads) as executor:
+            for _ in executor.map(_run_band, tasks):
+                pass
+
+        result = np.ndarray(output_shape, dtype=output_dtype, buffer=output_shm.buf).copy()
+        del source
+        return result
+    finally:
+        source_shm.close()
+        source_shm.unlink()
+        output_shm.close()
+        output_shm.unlink()
@@ -0,0 +1,312 @@
+"""处理流水线 - 在内存中串联多个操作, 只解码一次、只编码最终结果
+
+    Pipeline("photo.png").uniform_blur(5).normal_map(3).save("output/photo_normal.png")
+
+相邻的模板操作 (法向贴图、均匀模糊、高斯模糊) 合并为一次分块计算, 中间结果只存在于
+单个分块内; 径向模糊的采样射线可能很长, 单独作为一个阶段执行。
+"""
+import functools
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+import instrument
+from arrayio import is_array_path, open_array
+from cache import digest_array, make_key
+from parallel import run_parallel
+from pyramid import Pyramid, approximate_blur
+from tiling import (DEFAULT_MAX_MEMORY, HIGH_DEPTH_MODES, ProcessingCancelled, build_operation,
+                    image_array, process_tiled, run_tiled)
+from writer import write_array
+
+# 边缘固定的模板操作, 相邻时可以合并执行
+FUSIBLE_OPERATIONS = {"normal", "uniform_blur", "gaussian_blur"}
+
+# 可在解码时缩小的格式 (JPEG 按 1/2、1/4、1/8 做DCT缩放)
+DRAFT_FORMATS = {"JPEG"}
+
+
+def _approximate(step):
+    """是否为近似模式的步骤 (参数中带 quality, 在金字塔的粗层级上计算)"""
+    return bool(step[1].get("quality"))
+
+
+def _fusible(step):
+    return step[0] in FUSIBLE_OPERATIONS and not _approximate(step)
+
+
+def _reduce_to(image, size):
+    """用整数倍的盒式缩小把图像缩到不小于 size, 预览再由界面缩放到最终尺寸"""
+    factor = min(image.size[0] // size[0], image.size[1] // size[1])
+    if factor > 1:
+        image = image.reduce(factor)
+    return image
+
+
+class SourceImage:
+    """上传的源图像: 预览与处理共用, 每个文件只完整解码一次
+
+    可缩小解码的格式 (JPEG) 先只解码出预览大小, 完整分辨率在第一次处理时才解码;
+    其它格式打开时即完整解码, 预览由解码结果缩小得到。
+    """
+
+    def __init__(self, path, preview_size=(256, 256)):
+        self.path = path
+        self.lock = threading.Lock()
+        self._image = None
+        self._pyramid = None
+        image = Image.open(path)
+        self.size = image.size
+        self.format = image.format
+        if image.format in DRAFT_FORMATS:
+            image.draft(image.mode, preview_size)
+            image.load()
+        else:
+            image = self._load(image)
+            self._image = image
+        self.preview = _reduce_to(image, preview_size)
+
+    def _load(self, image):
+        with instrument.span("decode", path=self.path) as args:
+            image.load()
+            if instrument.enabled():
+                args["bytes_read"] = os.path.getsize(self.path)
+        return image
+
+    def image(self):
+        """完整分辨率的PIL图像 (已解码), 第一次调用时解码, 之后复用"""
+        with self.lock:
+            if self._image is None:
+                self._image = self._load(Image.open(self.path))
+            return self._image
+
+    def pyramid(self):
+        """完整图像的金字塔 (pyramid.Pyramid), 各层级第一次用到时生成, 之后复用"""
+        image = self.image()
+        with self.lock:
+            if self._pyramid is None:
+                self._pyramid = Pyramid(image)
+            return self._pyramid
+
+    def pipeline(self, cache=None, backend=None):
+        """以完整图像创建处理流水线, 缓存仍按源文件查找摘要, 近似模糊复用金字塔"""
+        return Pipeline(self.image(), cache, path=self.path, pyramid=self.pyramid(), backend=backend)
+
+
+class Pipeline:
+    """持有一个 ndarray, 记录处理步骤并在 run/save 时执行
+
+    从文件创建时先保留PIL图像, 第一个阶段按分块直接从中读取, 不额外复制整幅数组;
+    .npy 与 raw 文件以内存映射打开, 不需要解码 (raw 的形状与数据类型见 arrayio.open_array)。
+    source 为已解码的图像或数组时, 可用 path 给出来源文件, 缓存按文件查找摘要而不必重新计算。
+    模糊步骤给出 quality 时为近似模式 (见 pyramid.approximate_blur), 单独作为一个阶段整幅计算。
+    传入 cache (cache.ResultCache) 时, 相同像素经过相同步骤的结果直接从缓存取得。
+    backend 为计算后端名称 (见 backends.get_backend), 各后端结果相同, 缓存可以共用。
+    """
+
+    def __init__(self, source, cache=None, raw_shape=None, raw_dtype=None, path=None,
+                 pyramid=None, backend=None):
+        self.path = path
+        self.backend = backend
+        self.pyramid = pyramid  # 当前源图像的金字塔, 源图像改变后作废
+        self.layout = None  # 数组文件解释成的 (形状, 数据类型), 作为按文件查找摘要的一部分
+        if isinstance(source, (str, os.PathLike)):
+            self.path = source
+            if is_array_path(source):
+                source = open_array(source, raw_shape, raw_dtype)
+                self.layout = (source.shape, source.dtype.str)
+            else:
+                source = Image.open(source)
+        elif not isinstance(source, Image.Image):
+            source = np.asarray(source)
+        self.source = source
+        # 传入已打开的图像与其来源文件 path 时, 视为已解码 (见 SourceImage)
+        self.decoded = not isinstance(source, Image.Image) or path is not None
+        self.steps = []
+        self.cache = cache
+        self.digest = None  # 当前结果的内容摘要 (仅在使用缓存时计算)
+
+    @property
+    def array(self):
+        """当前结果 (需要时才从PIL图像转换为数组)"""
+        if isinstance(self.source, Image.Image):
+            self._decode()
+            self.source = image_array(self.source)
+        return self.source
+
+    @property
+    def size(self):
+        if isinstance(self.source, Image.Image):
+            return self.source.size
+        return self.source.shape[1], self.source.shape[0]
+
+    def _decode(self):
+        """解码源图像 (第一次需要像素时), 单独计时"""
+        if self.decoded:
+            return
+        with instrument.span("decode", path=self.path) as args:
+            self.source.load()
+            if self.path is not None and instrument.enabled():
+                args["bytes_read"] = os.path.getsize(self.path)
+        self.decoded = True
+
+    def normal_map(self, strength=5.0, kernel="central"):
+        """追加法向贴图步骤"""
+        self.steps.append(("normal", {"strength": strength, "kernel": kernel}))
+        return self
+
+    def uniform_blur(self, radius=3, quality=None):
+        """追加均匀模糊步骤 (给出 quality 时为近似模式)"""
+        params = {"radius": radius}
+        if quality:
+            params["quality"] = quality
+        self.steps.append(("uniform_blur", params))
+        return self
+
+    def gaussian_blur(self, sigma=2.0, quality=None):
+        """追加高斯模糊步骤 (给出 quality 时为近似模式)"""
+        params = {"sigma": sigma}
+        if quality:
+            params["quality"] = quality
+        self.steps.append(("gaussian_blur", params))
+        return self
+
+    def radial_blur(self, center=None, strength=0.02):
+        """追加径向模糊步骤"""
+        self.steps.append(("radial_blur", {"center": center, "strength": strength}))
+        return self
+
+    def stages(self):
+        """把待执行的步骤分组, 相邻的模板操作合并为同一阶段"""
+        stages = []
+        for step in self.steps:
+            if stages and _fusible(step) and _fusible(stages[-1][-1]):
+                stages[-1].append(step)
+            else:
+                stages.append([step])
+        return stages
+
+    def _run_stage(self, stage, tile_size, max_memory, workers, progress, cancel):
+        """执行一个阶段, 返回整幅结果"""
+        if _approximate(stage[0]):
+            # 粗层级上计算很快, 不分块也不多进程
+            if cancel is not None and cancel.is_set():
+                raise ProcessingCancelled()
+            name, params = stage[0]
+            source = self.array if self.pyramid is None else self.pyramid.level(0)
+            with instrument.span("compute", steps=[name], quality=params["quality"]):
+                result = approximate_blur(source, name, params, self.pyramid)
+            if progress is not None:
+                progress(1, 1)
+            return result
+        if workers and workers > 1:
+            source = self.array
+            with instrument.span("compute", steps=[name for name, _ in stage], workers=workers):
+                return run_parallel(source, stage, workers, self.backend)
+        self._decode()
+        with instrument.span("compute", steps=[name for name, _ in stage]):
+            operation = build_operation(stage, self.size, self.backend)
+            return run_tiled(self.source, operation, self._tile_size(tile_size, max_memory),
+                             max_memory or DEFAULT_MAX_MEMORY, progress, cancel)
+
+    def _tile_size(self, tile_size, max_memory):
+        """未指定 tile_size 与 max_memory、源图像也不超过默认内存上限时整幅作为一块计算
+
+        整幅计算时径向模糊可以复用缓存的整幅采样表 (见 engine.radial_blur_tables)。
+        """
+        if tile_size is not None or max_memory is not None:
+            return tile_size
+        if isinstance(self.source, Image.Image):
+            itemsize = 2 if self.source.mode in HIGH_DEPTH_MODES else 1
+            source_bytes = self.size[0] * self.size[1] * len(self.source.getbands()) * itemsize
+        else:
+            source_bytes = self.source.nbytes
+        return max(self.size) if source_bytes <= DEFAULT_MAX_MEMORY else None
+
+    def _source_digest(self):
+        """当前结果的摘要; 来自未改动过的已知文件时无需解码"""
+        if self.digest is None and self.path is not None:
+            self.digest = self.cache.lookup_path(self.path, self.layout)
+        if self.digest is None:
+            self.digest = digest_array(self.array)
+            if self.path is not None:
+                self.cache.remember_path(self.path, self.digest, self.layout)
+        return self.digest
+
+    def run(self, tile_size=None, max_memory=None, workers=None, progress=None, cancel=None):
+        """执行所有待处理步骤, 返回结果数组
+
+        tile_size / max_memory 控制分块大小, workers 大于1时每个阶段多进程并行;
+        progress 与 cancel 的含义同 tiling.iter_tiled。
+        """
+        key = None
+        if self.cache is not None and self.steps:
+            with instrument.span("cache_lookup") as args:
+                key = make_key(self._source_digest(), self.steps)
+                cached = self.cache.get(key)
+                args["hit"] = cached is not None
+            if cached is not None:
+                self.source = cached
+                self.pyramid = None
+                self.steps = []
+                self.digest = key
+                return cached
+
+        for stage in self.stages():
+            self.source = self._run_stage(stage, tile_size, max_memory, workers, progress, cancel)
+            self.pyramid = None
+        self.steps = []
+        if key is not None:
+            with instrument.span("cache_store"):
+                self.cache.put(key, self.array)
+            self.digest = key
+        return self.array
+
+    def to_image(self):
+        """执行并返回PIL图像"""
+        return Image.fromarray(self.run())
+
+    def save(self, output_path, tile_size=None, max_memory=None, workers=None,
+             progress=None, cancel=None, encoder=None, writer=None):
+        """执行并保存结果
+
+        指定 max_memory 或输出为 .npy / raw (且不使用多进程) 时, 最后一个阶段边算边写
+        (数组文件通过内存映射写入), 结果不再保留在内存中, 也不进入缓存;
+        否则先得到整幅结果再编码。
+        encoder 为各格式的编码参数 (见 writer.make_encoder); 传入 writer
+        (writer.BackgroundWriter) 时结果交给后台线程写出, 提交后立即返回。
+        使用缓存时, 若输出文件已是同一结果且未被改动, 则跳过编码。
+        """
+        stages = self.stages()
+        streaming = (max_memory or is_array_path(output_path)) and not (workers and workers > 1)
+        if not streaming or not stages or _approximate(stages[-1][0]):
+            self.run(tile_size, max_memory, workers, progress, cancel)
+            callback = None
+            if self.cache is not None and self.digest is not None:
+                if self.cache.output_current(output_path, self.digest):
+                    return True
+                callback = functools.partial(self.cache.record_output, output_path, self.digest)
+            if writer is not None:
+                writer.submit(self.array, output_path, encoder, callback)
+            else:
+                write_array(self.array, output_path, encoder)
+                if callback is not None:
+                    callback()
+            return True
+
+        for stage in stages[:-1]:
+            self.source = self._run_stage(stage, tile_size, max_memory, workers, progress, cancel)
+            self.pyramid = None
+        self._decode()
+        # 边算边写, 计算与编码交织在一起, 合并为一个阶段
+        with instrument.span("stream", steps=[name for name, _ in stages[-1]], path=output_path) as args:
+            operation = build_operation(stages[-1], self.size, self.backend)
+            process_tiled(self.source, output_path, operation, self._tile_size(tile_size, max_memory),
+                          max_memory or DEFAULT_MAX_MEMORY, progress, cancel, encoder)
+            if instrument.enabled():
+                args["bytes_written"] = os.path.getsize(output_path)
+        self.source = None
+        self.steps = []
+        return True
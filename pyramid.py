@@ -0,0 +1,147 @@
+"""图像金字塔 - 逐级2x2平均缩小, 用于预览和大半径模糊的近似计算
+
+    levels = Pyramid(pixels)
+    index, preview = levels.level_for((250, 250))     # 不小于预览框的最小一级
+    blurred = approximate_blur(pixels, "gaussian_blur", {"sigma": 60, "quality": 8}, levels)
+
+近似模式在较粗的一级上做模糊再双线性放大回原尺寸。quality 为粗层级上至少保留的
+模糊半径 (像素), 越大越接近精确结果、也越慢; 半径不足 2*quality 时直接精确计算。
+"""
+import math
+import threading
+
+import numpy as np
+from PIL import Image
+
+from engine import compute_gaussian_blur, compute_uniform_blur
+from tiling import image_array
+
+# 近似模式的默认质量
+DEFAULT_QUALITY = 8
+
+
+def downsample(pixels):
+    """2x2平均缩小一半 (奇数边长时复制最后一行/列), 保持数据类型"""
+    pixels = np.asarray(pixels)
+    height, width = pixels.shape[:2]
+    pad = ((0, height % 2), (0, width % 2)) + ((0, 0),) * (pixels.ndim - 2)
+    if height % 2 or width % 2:
+        pixels = np.pad(pixels, pad, mode="edge")
+    integer = np.issubdtype(pixels.dtype, np.integer)
+    acc_dtype = np.int64 if integer else np.float64
+    total = pixels[0::2, 0::2].astype(acc_dtype)
+    total += pixels[1::2, 0::2]
+    total += pixels[0::2, 1::2]
+    total += pixels[1::2, 1::2]
+    if integer:
+        total += 2
+        total //= 4
+    else:
+        total /= 4
+    return total.astype(pixels.dtype)
+
+
+def _linear_axis(values, size, factor, axis):
+    """沿一个轴线性插值放大到 size (粗像素中心对齐原像素块中心)"""
+    coarse = values.shape[axis]
+    position = (np.arange(size) + 0.5) / factor - 0.5
+    np.clip(position, 0, coarse - 1, out=position)
+    lower = position.astype(np.int64)
+    upper = np.minimum(lower + 1, coarse - 1)
+    weight = (position - lower).astype(np.float32)
+    weight = weight.reshape((-1,) + (1,) * (values.ndim - axis - 1))
+    result = np.take(values, lower, axis=axis).astype(np.float32)
+    result += (np.take(values, upper, axis=axis) - result) * weight
+    return result
+
+
+def upsample(pixels, shape, factor, dtype=None):
+    """双线性放大 factor 倍并裁剪到 shape (高, 宽), 整数类型四舍五入"""
+    pixels = np.asarray(pixels)
+    dtype = np.dtype(dtype or pixels.dtype)
+    # 先沿行方向放大 (此时宽度仍较小), 再沿列方向放大
+    result = _linear_axis(pixels, shape[0], factor, 0)
+    result = _linear_axis(result, shape[1], factor, 1)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        np.rint(result, out=result)
+        np.clip(result, info.min, info.max, out=result)
+    return result.astype(dtype)
+
+
+class Pyramid:
+    """逐级缩小的图像金字塔, 第0级为原图; 各级第一次用到时生成并保留
+
+    source 可以是数组或PIL图像 (第一次用到时才转换为数组)。可在多个线程间共用。
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.levels = []
+        self.lock = threading.Lock()
+
+    def level(self, index):
+        """第 index 级 (边长约为原图的 1/2^index); 缩到1像素后不再缩小"""
+        with self.lock:
+            if not self.levels:
+                self.levels.append(image_array(self.source) if isinstance(self.source, Image.Image)
+                                   else np.asarray(self.source))
+                self.source = None
+            while len(self.levels) <= index and max(self.levels[-1].shape[:2]) > 1:
+                self.levels.append(downsample(self.levels[-1]))
+            return self.levels[min(index, len(self.levels) - 1)]
+
+    def level_for(self, size):
+        """宽高都不小于 size (宽, 高) 的最小一级, 返回 (级数, 数组)"""
+        index = 0
+        pixels = self.level(0)
+        while (pixels.shape[1] >= 2 * size[0] and pixels.shape[0] >= 2 * size[1]
+               and max(pixels.shape[:2]) > 1):
+            index += 1
+            pixels = self.level(index)
+        return index, pixels
+
+
+def _box_variance(radius):
+    """半径为 radius 的盒式滤波的方差"""
+    return radius * (radius + 1) / 3.0
+
+
+def approximate_level(name, params):
+    """近似模式选用的 (级数, 该级上的参数)
+
+    缩小与双线性放大本身带来约 (4^L-1)/4 的方差 (原图像素), 在粗层级的模糊中扣除,
+    使总的模糊程度与精确计算一致。
+    """
+    quality = params.get("quality") or DEFAULT_QUALITY
+    radius = params["radius"] if name == "uniform_blur" else params["sigma"]
+    level = int(math.floor(math.log2(radius / quality))) if radius >= 2 * quality else 0
+    if level <= 0:
+        return 0, {key: value for key, value in params.items() if key != "quality"}
+
+    scale = 4 ** level
+    if name == "uniform_blur":
+        variance = (_box_variance(radius) - (scale - 1) / 4) / scale
+        coarse = int(round((math.sqrt(1 + 12 * max(variance, 0)) - 1) / 2))
+        return level, {"radius": coarse}
+    variance = (params["sigma"] ** 2 - (scale - 1) / 4) / scale
+    return level, {"sigma": math.sqrt(max(variance, 0))}
+
+
+def approximate_blur(pixels, name, params, pyramid=None):
+    """在金字塔的较粗层级上模糊后放大回原尺寸 (name 为 uniform_blur 或 gaussian_blur)
+
+    pixels 为原尺寸数组; 传入 pixels 的金字塔 pyramid 时直接复用其中已缩小的层级。
+    """
+    if name not in ("uniform_blur", "gaussian_blur"):
+        raise ValueError(f"不支持近似模式的处理类型: {name}")
+    compute = compute_uniform_blur if name == "uniform_blur" else compute_gaussian_blur
+    level, coarse_params = approximate_level(name, params)
+    if level == 0:
+        return compute(pixels, **coarse_params)
+
+    pixels = np.asarray(pixels)
+    if pyramid is None:
+        pyramid = Pyramid(pixels)
+    blurred = compute(pyramid.level(level), **coarse_params)
+    return upsample(blurred, pixels.shape[:2], 2 ** level, pixels.dtype)
@@ -0,0 +1,600 @@
+"""本地处理服务 - 通过HTTP (或Unix套接字) 提供法向贴图、模糊与噪声生成
+
+用法:
+    python server.py --port 8765 --workers 4
+    python server.py --unix-socket /tmp/imgproc.sock
+
+    curl --data-binary @a.png "http://127.0.0.1:8765/normal?strength=5" -o a_normal.png
+    curl --data-binary @a.png "http://127.0.0.1:8765/gaussian?sigma=20&format=jpeg" -o a_blur.jpg
+    curl "http://127.0.0.1:8765/noise?width=512&height=512&seed=1&kind=fbm" -o noise.png
+    curl "http://127.0.0.1:8765/metrics"
+
+请求体为图像文件的字节 (PIL可读的格式或 .npy), 响应为编码后的结果 (format 可选
+png/jpeg/tga/npy, 默认png)。处理在常驻的进程池中进行; 同一时间到达的同操作、
+同参数、同尺寸的请求合并为一次数组调用。排队与处理中的请求超过 --max-queue 时
+直接返回503, 由调用方稍后重试。只依赖标准库、NumPy与Pillow, 不需要外部服务。
+"""
+import argparse
+import collections
+import io
+import json
+import math
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from PIL import Image
+
+from backends import limit_worker_threads, select_backend
+from engine import NORMAL_KERNELS
+from noise import fbm_noise, white_noise
+from pipeline import Pipeline
+from tiling import HIGH_DEPTH_MODES, image_array
+
+# 路径 -> (Pipeline方法, {参数名: 类型})
+OPERATIONS = {
+    "normal": ("normal_map", {"strength": float, "kernel": str}),
+    "blur": ("uniform_blur", {"radius": int, "quality": int}),
+    "gaussian": ("gaussian_blur", {"sigma": float, "quality": int}),
+    "radial": ("radial_blur", {"strength": float, "cx": int, "cy": int}),
+}
+
+# 输出格式 -> (PIL格式名, Content-Type)
+FORMATS = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "tga": ("TGA", "image/x-tga"),
+    "npy": (None, "application/octet-stream"),
+}
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_MAX_BATCH = 8
+DEFAULT_BATCH_WAIT_MS = 5.0
+DEFAULT_MAX_BODY = 256 * 1024 * 1024
+REQUEST_TIMEOUT = 120.0
+# 每种操作保留的最近延迟样本数 (用于计算分位数)
+LATENCY_SAMPLES = 4096
+# PNG响应的默认压缩级别 (编码速度优先)
+PNG_COMPRESS_LEVEL = 1
+# /noise 的尺寸与倍频数上限; 默认 scale 下第16个倍频的格子已远小于一个像素
+MAX_NOISE_SIZE = 16384
+MAX_NOISE_OCTAVES = 16
+
+
+class RequestError(Exception):
+    """请求参数或内容有误, 对应的HTTP状态码在 status 中"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _warm_up():
+    """工作进程启动后先做一次小计算, 让导入与首次调用的开销不落在第一个请求上"""
+    Pipeline(np.zeros((8, 8), dtype=np.uint8)).uniform_blur(1).run()
+
+
+def run_batch(method, params, arrays):
+    """工作进程: 对一批同尺寸的图像执行同一操作, 返回结果列表
+
+    模糊逐通道独立计算, 沿通道轴拼接后一次处理, 与逐张处理的结果相同;
+    法向贴图只接受单通道, 在同一次调用内逐张处理。
+    """
+    if method == "normal_map" or len(arrays) == 1:
+        return [getattr(Pipeline(array), method)(**params).run() for array in arrays]
+    planes = [array if array.ndim == 3 else array[..., np.newaxis] for array in arrays]
+    result = getattr(Pipeline(np.concatenate(planes, axis=2)), method)(**params).run()
+    results = []
+    start = 0
+    for array, plane in zip(arrays, planes):
+        count = plane.shape[2]
+        results.append(result[..., start:start + count].reshape(array.shape))
+        start += count
+    return results
+
+
+def make_noise(params):
+    """工作进程: 生成噪声 (kind 为 white 或 fbm), 返回uint8数组"""
+    width, height = params["width"], params["height"]
+    if params["kind"] == "fbm":
+        noise = fbm_noise(width, height, octaves=params["octaves"], seed=params["seed"])
+        return (noise * 255).astype(np.uint8)
+    return white_noise(width, height, params["seed"], params["index"])
+
+
+class Metrics:
+    """请求计数、各操作的延迟分位数、吞吐量与批大小统计 (线程安全)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.invalid = 0  # 参数或请求体无效 (4xx), 不计入错误与延迟
+        self.operations = {}
+        self.recent = collections.deque()  # 最近60秒内完成请求的时间
+        self.batches = 0
+        self.batched_requests = 0
+        self.max_batch = 0
+
+    def record(self, operation, seconds, megapixels=0.0, error=False):
+        now = time.monotonic()
+        with self.lock:
+            item = self.operations.setdefault(operation, {
+                "count": 0, "errors": 0, "megapixels": 0.0,
+                "latencies": collections.deque(maxlen=LATENCY_SAMPLES)})
+            item["count"] += 1
+            item["megapixels"] += megapixels
+            item["latencies"].append(seconds)
+            if error:
+                item["errors"] += 1
+                self.errors += 1
+            else:
+                self.completed += 1
+            self.recent.append(now)
+            while self.recent and self.recent[0] < now - 60:
+                self.recent.popleft()
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def record_invalid(self):
+        with self.lock:
+            self.invalid += 1
+
+    def record_batch(self, size):
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += size
+            self.max_batch = max(self.max_batch, size)
+
+    def snapshot(self, in_flight=0, max_queue=0):
+        """当前统计 (可直接序列化为JSON), 延迟单位为毫秒"""
+        now = time.monotonic()
+        with self.lock:
+            uptime = now - self.started
+            recent = sum(1 for moment in self.recent if moment >= now - 60)
+            operations = {}
+            for name, item in self.operations.items():
+                latencies = np.array(item["latencies"]) * 1000
+                operations[name] = {
+                    "count": item["count"],
+                    "errors": item["errors"],
+                    "megapixels": round(item["megapixels"], 3),
+                    "latency_ms": {key: round(float(np.percentile(latencies, q)), 2)
+                                   for key, q in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))},
+                }
+            return {
+                "uptime_s": round(uptime, 1),
+                "in_flight": in_flight,
+                "max_queue": max_queue,
+                "completed": self.completed,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "invalid": self.invalid,
+                "throughput_rps": round(self.completed / uptime, 3) if uptime else 0.0,
+                "recent_rps": round(recent / min(uptime, 60), 3) if uptime else 0.0,
+                "batches": {
+                    "count": self.batches,
+                    "mean_size": round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+                    "max_size": self.max_batch,
+                },
+                "operations": operations,
+            }
+
+
+class Batcher:
+    """把同一键 (操作, 参数, 尺寸, 数据类型) 的请求攒成一批再交给进程池
+
+    第一个请求到达后最多等待 max_wait 秒, 或攒满 max_batch 个时发出; 同时最多有
+    slots 批在处理 (等于工作进程数), 工作进程都忙时请求继续累积, 负载越高批越大。
+    """
+
+    def __init__(self, executor, metrics, max_batch=DEFAULT_MAX_BATCH,
+                 max_wait=DEFAULT_BATCH_WAIT_MS / 1000, slots=1):
+        self.executor = executor
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.slots = slots
+        self.busy = 0
+        self.condition = threading.Condition()
+        self.pending = {}  # 键 -> (最迟发出时间, [(数组, Future), ...])
+        self.closed = False
+        self.thread = threading.Thread(target=self._dispatch, name="batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, method, params, array):
+        """提交一张图像, 返回 Future, 结果为处理后的数组"""
+        future = Future()
+        key = (method, tuple(sorted(params.items())), array.shape, array.dtype.str)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("服务正在关闭")
+            _, items = self.pending.setdefault(key, (time.monotonic() + self.max_wait, []))
+            items.append((array, future))
+            # 新的键需要让分发线程重新计算等待时间
+            if len(items) == 1 or len(items) == self.max_batch:
+                self.condition.notify()
+        return future
+
+    def _take_ready(self):
+        """在有空闲名额时取出已满或已到时间的批 (先到期的优先)
+
+        返回 ([(键, 请求列表)], 下一个最迟时间); 关闭时取出全部。
+        """
+        now = time.monotonic()
+        ready = []
+        next_deadline = None
+        for key, (deadline, items) in sorted(self.pending.items(), key=lambda pair: pair[1][0]):
+            due = len(items) >= self.max_batch or deadline <= now
+            if self.closed or (due and self.busy < self.slots):
+                batch, rest = items[:self.max_batch], items[self.max_batch:]
+                if rest:
+                    self.pending[key] = (deadline, rest)
+                else:
+                    del self.pending[key]
+                ready.append((key, batch))
+                self.busy += 1
+            elif not due and (next_deadline is None or deadline < next_deadline):
+                next_deadline = deadline
+        return ready, next_deadline
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                ready, next_deadline = self._take_ready()
+                while not ready:
+                    if self.closed and not self.pending:
+                        return
+                    timeout = None if next_deadline is None else max(next_deadline - time.monotonic(), 0)
+                    self.condition.wait(timeout)
+                    ready, next_deadline = self._take_ready()
+            for key, items in ready:
+                self._send(key, items)
+
+    def _finished(self):
+        with self.condition:
+            self.busy -= 1
+            self.condition.notify()
+
+    def _send(self, key, items):
+        method, params = key[0], dict(key[1])
+        self.metrics.record_batch(len(items))
+        try:
+            batch = self.executor.submit(run_batch, method, params, [array for array, _ in items])
+        except Exception as error:
+            self._finished()
+            for _, future in items:
+                future.set_exception(error)
+            return
+
+        def finish(batch):
+            self._finished()
+            try:
+                results = batch.result()
+            except Exception as error:
+                for _, future in items:
+                    future.set_exception(error)
+                return
+            for (_, future), result in zip(items, results):
+                future.set_result(result)
+        batch.add_done_callback(finish)
+
+    def close(self):
+        """发出所有等待中的批并停止分发线程"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+
+def decode_image(body, operation):
+    """请求体 -> 数组; 法向贴图转换为灰度, 调色板图像展开为RGB(A)"""
+    if not body:
+        raise RequestError("请求体为空, 需要图像文件的字节")
+    try:
+        if body[:6] == b"\x93NUMPY":
+            return np.load(io.BytesIO(body), allow_pickle=False)
+        with Image.open(io.BytesIO(body)) as image:
+            if operation == "normal" and image.mode != "L" and image.mode not in HIGH_DEPTH_MODES:
+                image = image.convert("L")
+            elif image.mode in ("P", "PA"):
+                image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+            return image_array(image)
+    except Exception as error:
+        raise RequestError(f"无法解码图像: {error}") from error
+
+
+def encode_array(array, output_format):
+    """数组 -> (响应字节, Content-Type)"""
+    pil_format, content_type = FORMATS[output_format]
+    buffer = io.BytesIO()
+    if pil_format is None:
+        np.save(buffer, array, allow_pickle=False)
+    else:
+        params = {"compress_level": PNG_COMPRESS_LEVEL} if pil_format == "PNG" else {}
+        Image.fromarray(array).save(buffer, format=pil_format, **params)
+    return buffer.getvalue(), content_type
+
+
+def _parse_params(query, spec):
+    """按 {参数名: 类型} 从查询参数中取值, 未给出的参数使用处理函数的默认值"""
+    params = {}
+    for name, kind in spec.items():
+        if name in query:
+            try:
+                params[name] = kind(query[name][-1])
+            except ValueError as error:
+                raise RequestError(f"参数 {name} 无效: {query[name][-1]}") from error
+            if kind is float and not math.isfinite(params[name]):
+                raise RequestError(f"参数 {name} 无效: {query[name][-1]}")
+    return params
+
+
+def _check_params(method, params, array):
+    """在排队之前检查参数与图像, 无效时抛出 RequestError (400), 不进入工作进程"""
+    if params.get("strength", 1.0) <= 0:
+        raise RequestError("参数 strength 必须大于0")
+    if params.get("kernel", "central") not in NORMAL_KERNELS:
+        raise RequestError(f"未知的梯度核: {params['kernel']}, 可选 {', '.join(NORMAL_KERNELS)}")
+    for name in ("radius", "sigma"):
+        if params.get(name, 0) < 0:
+            raise RequestError(f"参数 {name} 不能为负数")
+    if params.get("quality", 1) <= 0:
+        raise RequestError("参数 quality 必须大于0")
+    if method == "normal_map" and array.ndim != 2:
+        raise RequestError("法向贴图需要单通道灰度图像")
+    if method == "normal_map" and min(array.shape) < 3:
+        raise RequestError("法向贴图的图像尺寸至少需要3x3像素")
+
+
+class ProcessingService:
+    """服务本体: 进程池、批处理、背压与统计, 与具体的传输方式 (TCP/Unix套接字) 无关"""
+
+    def __init__(self, workers=None, max_queue=DEFAULT_MAX_QUEUE, max_batch=DEFAULT_MAX_BATCH,
+                 batch_wait_ms=DEFAULT_BATCH_WAIT_MS, max_body=DEFAULT_MAX_BODY):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=limit_worker_threads)
+        # 预先启动全部工作进程
+        for future in [self.executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+        self.metrics = Metrics()
+        self.batcher = Batcher(self.executor, self.metrics, max_batch, batch_wait_ms / 1000,
+                               self.workers)
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.slots = threading.BoundedSemaphore(max_queue)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def acquire(self):
+        """占用一个排队名额, 已满时返回 False (调用方应返回503)"""
+        if not self.slots.acquire(blocking=False):
+            self.metrics.record_rejected()
+            return False
+        with self.lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+    def process(self, operation, query, body):
+        """处理一张图像, 返回 (结果数组, 百万像素数)"""
+        method, spec = OPERATIONS[operation]
+        params = _parse_params(query, spec)
+        if method == "radial_blur":
+            cx, cy = params.pop("cx", None), params.pop("cy", None)
+            params["center"] = None if cx is None or cy is None else (cx, cy)
+        array = decode_image(body, operation)
+        if array.ndim not in (2, 3):
+            raise RequestError(f"不支持的数组形状: {array.shape}")
+        _check_params(method, params, array)
+        future = self.batcher.submit(method, params, array)
+        return future.result(REQUEST_TIMEOUT), array.shape[0] * array.shape[1] / 1e6
+
+    def noise(self, query):
+        spec = {"width": int, "height": int, "seed": int, "index": int, "octaves": int, "kind": str}
+        params = {"width": 256, "height": 256, "seed": None, "index": 0, "octaves": 5, "kind": "white"}
+        params.update(_parse_params(query, spec))
+        if params["kind"] not in ("white", "fbm"):
+            raise RequestError(f"未知的噪声类型: {params['kind']}")
+        if not (0 < params["width"] <= MAX_NOISE_SIZE and 0 < params["height"] <= MAX_NOISE_SIZE):
+            raise RequestError(f"噪声尺寸需在 1-{MAX_NOISE_SIZE} 之间")
+        if not 1 <= params["octaves"] <= MAX_NOISE_OCTAVES:
+            raise RequestError(f"倍频数需在 1-{MAX_NOISE_OCTAVES} 之间")
+        if params["seed"] is not None and params["seed"] < 0:
+            raise RequestError("种子不能为负数")
+        if params["index"] < 0:
+            raise RequestError("序号不能为负数")
+        result = self.executor.submit(make_noise, params).result(REQUEST_TIMEOUT)
+        return result, params["width"] * params["height"] / 1e6
+
+    def metrics_snapshot(self):
+        return self.metrics.snapshot(self.in_flight, self.max_queue)
+
+    def close(self):
+        self.batcher.close()
+        self.executor.shutdown(wait=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "ImageProcessing/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Unix套接字没有客户端地址
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data, headers=None):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), headers=headers)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.service.max_body:
+            raise RequestError(f"请求体超过上限 {self.service.max_body} 字节", 413)
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip("/")
+        if name == "health":
+            self._send_json(200, {"status": "ok", "workers": self.service.workers})
+        elif name == "metrics":
+            self._send_json(200, self.service.metrics_snapshot())
+        elif name == "noise":
+            self._handle("noise", parse_qs(url.query), None)
+        else:
+            self._send_json(404, {"error": f"未知的路径: {url.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        name = url.path.strip("/")
+        if name not in OPERATIONS:
+            # 读掉请求体, 保持连接可复用
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self._send_json(404, {"error": f"未知的操作: {url.path}, 可用: {', '.join(sorted(OPERATIONS))}"})
+            return
+        self._handle(name, parse_qs(url.query), True)
+
+    def _handle(self, operation, query, has_body):
+        start = time.perf_counter()
+        if not self.service.acquire():
+            if has_body:
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self._send_json(503, {"error": "服务繁忙, 请稍后重试"}, {"Retry-After": "1"})
+            return
+        try:
+            output_format = query.get("format", ["png"])[-1].lower()
+            if output_format not in FORMATS:
+                raise RequestError(f"不支持的输出格式: {output_format}")
+            if has_body:
+                body = self._read_body()
+                result, megapixels = self.service.process(operation, query, body)
+            else:
+                result, megapixels = self.service.noise(query)
+            data, content_type = encode_array(result, output_format)
+        except RequestError as error:
+            self.service.metrics.record_invalid()
+            if error.status == 413:
+                self.close_connection = True  # 请求体未读取, 连接不能复用
+            self._send_json(error.status, {"error": str(error)})
+            return
+        except Exception as error:
+            self.service.metrics.record(operation, time.perf_counter() - start, error=True)
+            self._send_json(500, {"error": f"{type(error).__name__}: {error}"})
+            return
+        finally:
+            self.service.release()
+        self.service.metrics.record(operation, time.perf_counter() - start, megapixels)
+        self._send(200, data, content_type)
+
+
+class TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 突发连接较多时不在 accept 之前被拒绝
+    verbose = False
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+    verbose = False
+
+
+def create_server(service, host="127.0.0.1", port=DEFAULT_PORT, unix_socket=None, verbose=False):
+    """创建HTTP服务器 (给出 unix_socket 时监听Unix套接字), 尚未开始服务"""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = UnixServer(unix_socket, RequestHandler)
+    else:
+        server = TCPServer((host, port), RequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="server.py", description="本地图像处理服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认只接受本机连接)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="端口")
+    parser.add_argument("--unix-socket", default=None, help="改为监听Unix套接字")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE,
+                        help="排队与处理中的请求上限, 超出时返回503")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="每批最多合并的请求数")
+    parser.add_argument("--batch-wait-ms", type=float, default=DEFAULT_BATCH_WAIT_MS,
+                        help="第一个请求到达后等待同类请求的最长时间 (毫秒)")
+    parser.add_argument("--max-body-mb", type=int, default=DEFAULT_MAX_BODY // (1024 * 1024),
+                        help="请求体大小上限 (MB)")
+    parser.add_argument("--backend", choices=["auto", "numpy", "numba"], default=None,
+                        help="计算后端 (默认取环境变量 IMGPROC_BACKEND), 工作进程预热时加载JIT缓存")
+    parser.add_argument("--verbose", action="store_true", help="打印每个请求的访问日志")
+    return parser
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.backend:
+        try:
+            select_backend(args.backend)
+        except ValueError as e:
+            print(e)
+            return 1
+    service = ProcessingService(args.workers, args.max_queue, args.max_batch, args.batch_wait_ms,
+                                args.max_body_mb * 1024 * 1024)
+    server = create_server(service, args.host, args.port, args.unix_socket, args.verbose)
+    where = args.unix_socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"处理服务已启动: {where} ({service.workers} 个工作进程), Ctrl+C 停止")
+    # SIGTERM 与 Ctrl+C 相同: 停止接受请求, 处理完排队中的批后退出
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""各计算后端 (整幅与分块) 与逐像素循环参考实现的对比"""
+import math
+
+import numpy as np
+import pytest
+
+from backends import available_backends
+from engine import GAUSSIAN_BOX_MIN_SIGMA, GAUSSIAN_PASSES, GAUSSIAN_TRUNCATE, gaussian_box_pass
+from tiling import build_operation, run_tiled
+
+BACKENDS = available_backends()
+TILE_SIZES = [None, 16]
+
+
+def _image(shape, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+
+def _run(pixels, step, backend, tile_size):
+    """tile_size 为 None 时整幅一块计算, 否则按 tile_size 分块"""
+    height, width = pixels.shape[:2]
+    operation = build_operation([step], (width, height), backend)
+    return run_tiled(pixels, operation, tile_size or max(width, height))
+
+
+def uniform_reference(pixels, radius):
+    """窗口在边界处收缩, 整数均值向下取整"""
+    height, width = pixels.shape[:2]
+    out = np.empty_like(pixels)
+    for y in range(height):
+        for x in range(width):
+            window = pixels[max(0, y - radius):y + radius + 1, max(0, x - radius):x + radius + 1]
+            out[y, x] = window.sum(axis=(0, 1), dtype=np.int64) // (window.shape[0] * window.shape[1])
+    return out
+
+
+def radial_reference(pixels, center, strength):
+    """沿指向中心的方向取 int(距离*强度)+1 个点, 坐标向零截断, 图像外的点不计入"""
+    height, width = pixels.shape[:2]
+    cx, cy = center
+    out = np.empty_like(pixels)
+    for y in range(height):
+        for x in range(width):
+            dx, dy = x - cx, y - cy
+            distance = math.sqrt(dx * dx + dy * dy)
+            if distance > 0:
+                dx, dy = dx / distance, dy / distance
+            total = np.zeros(pixels.shape[2:], dtype=np.int64)
+            count = 0
+            for i in range(int(distance * strength) + 1):
+                sample_x, sample_y = int(x - dx * i), int(y - dy * i)
+                if 0 <= sample_x < width and 0 <= sample_y < height:
+                    total += pixels[sample_y, sample_x]
+                    count += 1
+            out[y, x] = total // count
+    return out
+
+
+def normal_reference(pixels, strength):
+    """中心差分法向量, 边界复制相邻一行/一列"""
+    height, width = pixels.shape
+    gray = pixels.astype(np.float64)
+    out = np.zeros((height, width, 3), dtype=np.uint8)
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            dx = (gray[y, x + 1] - gray[y, x - 1]) / 255.0
+            dy = (gray[y + 1, x] - gray[y - 1, x]) / 255.0
+            dz = 1.0 / strength
+            length = math.sqrt(dx * dx + dy * dy + dz * dz)
+            out[y, x] = [int((v / length + 1) * 127.5) for v in (dx, dy, dz)]
+    out[0], out[-1] = out[1], out[-2]
+    out[:, 0], out[:, -1] = out[:, 1], out[:, -2]
+    return out
+
+
+def gaussian_kernel(sigma):
+    """实际使用的一维核: 小 sigma 为截断的采样高斯核, 否则为扩展盒式核自身卷积 GAUSSIAN_PASSES 次"""
+    if sigma < GAUSSIAN_BOX_MIN_SIGMA:
+        radius = int(math.ceil(GAUSSIAN_TRUNCATE * sigma))
+        kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+        return kernel / kernel.sum()
+    r, alpha = gaussian_box_pass(sigma)
+    box = np.ones(2 * r + 3)
+    box[0] = box[-1] = alpha
+    box /= box.sum()
+    kernel = np.ones(1)
+    for _ in range(GAUSSIAN_PASSES):
+        kernel = np.convolve(kernel, box)
+    return kernel
+
+
+def gaussian_reference(pixels, sigma):
+    """逐像素与可分离核做卷积, 边界复制边缘像素"""
+    kernel = gaussian_kernel(sigma)
+    half = len(kernel) // 2
+    height, width = pixels.shape[:2]
+    rows = np.empty(pixels.shape, dtype=np.float64)
+    for y in range(height):
+        for x in range(width):
+            total = 0.0
+            for i, weight in enumerate(kernel):
+                total = total + weight * pixels[y, min(max(x + i - half, 0), width - 1)].astype(np.float64)
+            rows[y, x] = total
+    out = np.empty(pixels.shape, dtype=np.float64)
+    for y in range(height):
+        for x in range(width):
+            total = 0.0
+            for i, weight in enumerate(kernel):
+                total = total + weight * rows[min(max(y + i - half, 0), height - 1), x]
+            out[y, x] = total
+    return np.clip(np.rint(out), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("tile_size", TILE_SIZES)
+@pytest.mark.parametrize("shape", [(37, 45), (30, 41, 3)])
+def test_uniform_blur(backend, tile_size, shape):
+    pixels = _image(shape)
+    result = _run(pixels, ("uniform_blur", {"radius": 4}), backend, tile_size)
+    np.testing.assert_array_equal(result, uniform_reference(pixels, 4))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("tile_size", TILE_SIZES)
+@pytest.mark.parametrize("shape", [(37, 45), (30, 41, 3)])
+@pytest.mark.parametrize("center, strength", [((17, 12), 0.15), ((-20, 8), 0.4), ((10, 20), 1.6)])
+def test_radial_blur(backend, tile_size, shape, center, strength):
+    """包括中心在图像外、强度大于1等部分采样点落在图像外的情况"""
+    pixels = _image(shape, 1)
+    result = _run(pixels, ("radial_blur", {"center": center, "strength": strength}), backend, tile_size)
+    np.testing.assert_array_equal(result, radial_reference(pixels, center, strength))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("tile_size", TILE_SIZES)
+def test_normal_map(backend, tile_size):
+    pixels = _image((33, 40), 2)
+    result = _run(pixels, ("normal", {"strength": 5.0, "kernel": "central"}), backend, tile_size)
+    # 内核用float32计算, 截断取整时个别像素可能与float64的参考值差1
+    difference = np.abs(result.astype(int) - normal_reference(pixels, 5.0))
+    assert difference.max() <= 1
+    assert (difference == 0).mean() > 0.99
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("tile_size", TILE_SIZES)
+@pytest.mark.parametrize("sigma", [1.2, 3.0])
+@pytest.mark.parametrize("shape", [(31, 38), (26, 29, 3)])
+def test_gaussian_blur(backend, tile_size, sigma, shape):
+    pixels = _image(shape, 3)
+    result = _run(pixels, ("gaussian_blur", {"sigma": sigma}), backend, tile_size)
+    # 盒式近似的中间结果为 1/256 精度的定点数, 与浮点参考值最多差1
+    difference = np.abs(result.astype(int) - gaussian_reference(pixels, sigma))
+    assert difference.max() <= 1
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_fused_gaussian_tiles(backend):
+    # 与其它操作合并时高斯模糊按方块计算, 左右边缘为相邻的真实像素
+    pixels = _image((40, 50, 3), 4)
+    steps = [("uniform_blur", {"radius": 2}), ("gaussian_blur", {"sigma": 3.0})]
+    operation = build_operation(steps, (50, 40), backend)
+    assert not operation.rows
+    expected = gaussian_reference(uniform_reference(pixels, 2), 3.0)
+    difference = np.abs(run_tiled(pixels, operation, 16).astype(int) - expected)
+    assert difference.max() <= 1
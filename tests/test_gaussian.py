@@ -0,0 +1,70 @@
+"""高斯模糊与精确采样高斯核的误差不超过 engine.gaussian_error_bound"""
+import numpy as np
+import pytest
+
+from engine import compute_gaussian_blur, gaussian_error_bound, gaussian_kernel
+
+
+def exact_kernel(sigma, half):
+    kernel = np.exp(-0.5 * (np.arange(-half, half + 1) / sigma) ** 2)
+    return kernel / kernel.sum()
+
+
+def exact_blur(pixels, sigma):
+    """与 ±6σ 采样高斯核做可分离卷积 (浮点, 不取整), 边界复制边缘像素"""
+    half = int(np.ceil(6 * sigma))
+    kernel = exact_kernel(sigma, half)
+    result = pixels.astype(np.float64)
+    for axis in (0, 1):
+        padded = np.pad(result, [(half, half) if i == axis else (0, 0) for i in range(result.ndim)],
+                        mode="edge")
+        padded = np.moveaxis(padded, axis, 0)
+        size = padded.shape[0] - 2 * half
+        result = sum(weight * padded[offset:offset + size] for offset, weight in enumerate(kernel))
+        result = np.moveaxis(result, 0, axis)
+    return result
+
+
+def stripes(shape, period):
+    x = np.arange(shape[1])
+    return np.broadcast_to(np.where(x % period < period // 2, 255, 0), shape).astype(np.uint8)
+
+
+def worst_case(sigma):
+    """在实际核大于精确核处取255的图像, 中心像素的误差达到上界"""
+    actual = gaussian_kernel(sigma)
+    half = max(len(actual) // 2, int(np.ceil(6 * sigma)))
+    exact = exact_kernel(sigma, half)
+    padded = np.zeros_like(exact)
+    offset = half - len(actual) // 2
+    padded[offset:offset + len(actual)] = actual
+    return (np.outer(padded, padded) > np.outer(exact, exact)).astype(np.uint8) * 255
+
+
+@pytest.mark.parametrize("sigma", [1.0, 2.0, 2.8, 5.0, 11.25])
+@pytest.mark.parametrize("pattern", ["noise", "stripes14", "square38", "worst"])
+def test_error_within_bound(sigma, pattern):
+    if pattern == "noise":
+        pixels = np.random.default_rng(0).integers(0, 256, (80, 90), dtype=np.uint8)
+    elif pattern == "stripes14":
+        pixels = stripes((60, 120), 14)
+    elif pattern == "square38":
+        pixels = stripes((60, 160), 38)
+    else:
+        pixels = worst_case(sigma)
+    error = np.abs(compute_gaussian_blur(pixels, sigma) - exact_blur(pixels, sigma))
+    assert error.max() <= gaussian_error_bound(sigma)
+
+
+@pytest.mark.parametrize("sigma", [2.8, 5.0, 11.25])
+def test_bound_is_reached(sigma):
+    pixels = worst_case(sigma)
+    center = pixels.shape[0] // 2
+    error = abs(compute_gaussian_blur(pixels, sigma)[center, center] - exact_blur(pixels, sigma)[center, center])
+    assert error >= gaussian_error_bound(sigma) - 1.0
+
+
+def test_bound_values():
+    # 8位图像上盒式近似的误差不超过8级, 直接卷积时只有取整误差
+    assert max(gaussian_error_bound(sigma) for sigma in np.arange(2.0, 40.0, 0.1)) <= 8.0
+    assert max(gaussian_error_bound(sigma) for sigma in np.arange(0.3, 2.0, 0.1)) <= 0.51
@@ -0,0 +1,49 @@
+"""Pipeline 的分块选择与输出格式"""
+import numpy as np
+import pytest
+
+import engine
+from arrayio import open_array
+from cache import ResultCache
+from pipeline import Pipeline
+
+
+def test_radial_tables_reused_without_tiling(monkeypatch):
+    """未指定分块参数时整幅计算, 第二次径向模糊直接复用缓存的采样表"""
+    pixels = np.random.default_rng(0).integers(0, 256, (1100, 1100, 3), dtype=np.uint8)
+    engine.clear_radial_cache()
+    builds = []
+    build = engine._build_radial_tables
+    monkeypatch.setattr(engine, "_build_radial_tables", lambda *args: builds.append(args) or build(*args))
+
+    first = Pipeline(pixels, backend="numpy").radial_blur(strength=0.03).run()
+    second = Pipeline(pixels, backend="numpy").radial_blur(strength=0.03).run()
+    assert len(builds) == 1
+    tiled = Pipeline(pixels, backend="numpy").radial_blur(strength=0.03).run(tile_size=256)
+    assert np.array_equal(first, second)
+    assert np.array_equal(first, tiled)
+    engine.clear_radial_cache()
+
+
+def test_raw_output_must_match_extension(tmp_path):
+    """raw 没有文件头: 法向贴图 (RGB 8位) 不能写为 .r16, 16位模糊结果可以原样读回"""
+    heights = np.random.default_rng(1).integers(0, 65536, (40, 40), dtype=np.uint16)
+    with pytest.raises(ValueError):
+        Pipeline(heights).normal_map().save(str(tmp_path / "normal.r16"))
+    assert not (tmp_path / "normal.r16").exists()
+
+    Pipeline(heights).uniform_blur(2).save(str(tmp_path / "blur.r16"))
+    expected = Pipeline(heights).uniform_blur(2).run()
+    np.testing.assert_array_equal(open_array(str(tmp_path / "blur.r16")), expected)
+
+
+def test_raw_layout_in_path_digest(tmp_path):
+    """同一个 raw 文件按不同形状解释时不能复用按文件记录的摘要"""
+    path = str(tmp_path / "terrain.raw")
+    np.arange(32 * 32, dtype="<u2").tofile(path)
+    cache = ResultCache()
+    square = Pipeline(path, cache).uniform_blur(1).run()
+    wide = Pipeline(path, cache, raw_shape=(16, 64)).uniform_blur(1).run()
+    assert wide.shape == (16, 64)
+    np.testing.assert_array_equal(wide, Pipeline(path, raw_shape=(16, 64)).uniform_blur(1).run())
+    np.testing.assert_array_equal(square, Pipeline(path).uniform_blur(1).run())
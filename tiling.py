@@ -0,0 +1,387 @@
+"""分块处理 - 逐块计算并流式写出, 用于超大图像
+
+每个分块会向外扩展一圈与卷积核同宽的边缘 (模糊半径 / 高斯核宽度 / 法向贴图1像素 /
+径向模糊的采样射线), 计算后裁掉边缘, 因此结果与整幅计算逐位相同。
+"""
+import math
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from engine import gaussian_halo
+from arrayio import create_array, is_array_path
+from backends import get_backend
+from writer import encoder_params, write_array
+
+# 默认内存上限 (字节)
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024
+MIN_TILE_SIZE = 64
+MAX_TILE_SIZE = 4096
+
+# 分块操作描述:
+# mode        - 读取源图像时需要转换到的PIL模式 (None 表示保持原样)
+# halo        - 分块向外扩展的最大宽度, 用于估算内存
+# work_bytes  - 计算时每个源像素每个通道大约占用的字节数
+# out_bytes   - 输出每个像素每个通道占用的字节数 (None 表示与输入相同)
+# compute     - compute(read, size, box) 返回 box 区域的结果
+# rows        - 按整行条带分块 (可分离的滤波, 整行时左右只需复制边缘, 不重复计算边缘)
+TiledOperation = namedtuple("TiledOperation",
+                            ["name", "mode", "halo", "work_bytes", "out_bytes", "compute", "rows"],
+                            defaults=(False,))
+
+
+def _expand_box(box, halo, size):
+    """向四周扩展 halo 像素并裁剪到图像范围内"""
+    left, upper, right, lower = box
+    width, height = size
+    return (max(left - halo, 0), max(upper - halo, 0),
+            min(right + halo, width), min(lower + halo, height))
+
+
+def _stencil_tile(read, size, box, halo, compute):
+    """读取带边缘的源区域, 计算后裁剪回 box"""
+    source_box = _expand_box(box, halo, size)
+    result = compute(read(source_box))
+    left, upper, right, lower = box
+    x0 = left - source_box[0]
+    y0 = upper - source_box[1]
+    return result[y0:y0 + lower - upper, x0:x0 + right - left]
+
+
+def normal_map_operation(strength=5.0, kernel="central", backend=None):
+    """法向贴图的分块操作 (梯度只需1像素边缘, 多取1像素保证图像边上的窄分块也不小于3x3)
+
+    backend 为计算后端名称 (见 backends.get_backend), 下同。
+    """
+    normal_map = get_backend(backend).normal_map
+
+    def compute(read, size, box):
+        return _stencil_tile(read, size, box, 2,
+                             lambda slab: normal_map(slab, strength, kernel))
+    return TiledOperation("normal", "L", 2, 32, 3, compute)
+
+
+def uniform_blur_operation(radius=3, backend=None):
+    """均匀模糊的分块操作 (边缘为模糊半径)"""
+    uniform_blur = get_backend(backend).uniform_blur
+
+    def compute(read, size, box):
+        return _stencil_tile(read, size, box, radius,
+                             lambda slab: uniform_blur(slab, radius))
+    return TiledOperation("uniform_blur", None, radius, 32, None, compute)
+
+
+def gaussian_blur_operation(sigma=2.0, backend=None):
+    """高斯模糊的分块操作 (边缘见 engine.gaussian_halo, 图像边界外复制边缘像素)
+
+    边缘随 sigma 增大 (sigma=100 时每侧348像素), 按整行条带分块: 左右两侧在图像边界上,
+    只需复制边缘列而不必计算, 重复计算的只有条带上下的边缘行。
+    """
+    halo = gaussian_halo(sigma)
+    gaussian_blur_padded = get_backend(backend).gaussian_blur_padded
+
+    def compute(read, size, box):
+        source_box = _expand_box(box, halo, size)
+        slab = read(source_box)
+        if halo == 0:
+            return slab.copy()
+        # 只在图像边界处补边, 分块之间的边缘取真实像素; 左右的补边在竖直方向之后才复制
+        left, upper, right, lower = box
+        pad = ((halo - (upper - source_box[1]), halo - (source_box[3] - lower)), (0, 0))
+        pad += ((0, 0),) * (slab.ndim - 2)
+        pad_x = (halo - (left - source_box[0]), halo - (source_box[2] - right))
+        return gaussian_blur_padded(np.pad(slab, pad, mode="edge"), sigma, slab.dtype, pad_x)
+    return TiledOperation("gaussian_blur", None, halo, 12, None, compute, rows=True)
+
+
+def radial_blur_operation(size, center=None, strength=0.02, backend=None):
+    """径向模糊的分块操作 (边缘为最长采样射线)"""
+    width, height = size
+    if center is None:
+        center = (width // 2, height // 2)
+    cx, cy = center
+
+    # 最远的角点决定最长射线
+    reach = max(math.hypot(x - cx, y - cy) for x in (0, width) for y in (0, height))
+    halo = int(reach * strength) + 1
+
+    radial_blur_window = get_backend(backend).radial_blur_window
+
+    def compute(read, size, box):
+        return radial_blur_window(read, width, height, cx, cy, strength, box)
+    return TiledOperation("radial_blur", None, halo, 12 * halo + 16, None, compute)
+
+
+# 处理名称 -> 分块操作工厂, 供多进程与流水线按名称重建操作
+OPERATION_FACTORIES = {
+    "normal": lambda size, params, backend: normal_map_operation(**params, backend=backend),
+    "uniform_blur": lambda size, params, backend: uniform_blur_operation(**params, backend=backend),
+    "gaussian_blur": lambda size, params, backend: gaussian_blur_operation(**params, backend=backend),
+    "radial_blur": lambda size, params, backend: radial_blur_operation(size, **params, backend=backend),
+}
+
+
+def build_operation(steps, size, backend=None):
+    """由 [(名称, 参数), ...] 构建 (串联的) 分块操作, backend 为计算后端名称"""
+    operation = None
+    for name, params in steps:
+        if name not in OPERATION_FACTORIES:
+            raise ValueError(f"未知的处理类型: {name}")
+        step = OPERATION_FACTORIES[name](size, params, backend)
+        operation = step if operation is None else chain_operations(operation, step)
+    return operation
+
+
+def chain_operations(first, second):
+    """把两个分块操作串联为一个, 第二个操作需要的源区域由第一个操作现场计算
+
+    中间结果只存在于单个分块内, 不会生成整幅的中间图像; 各自按真实图像边界
+    处理边缘, 所以与先后整幅执行两个操作的结果相同。
+    """
+    def compute(read, size, box):
+        def read_first(source_box):
+            return _convert_region(first.compute(read, size, source_box), second.mode)
+        return second.compute(read_first, size, box)
+    return TiledOperation(f"{first.name}+{second.name}", first.mode,
+                          first.halo + second.halo,
+                          max(first.work_bytes, second.work_bytes),
+                          second.out_bytes or first.out_bytes, compute, first.rows and second.rows)
+
+
+# 16位灰度在PIL中的模式 (16位PNG为 I;16, 旧版Pillow与部分TIFF为 I);
+# 转为 "L" 会截断到255, 这类图像改为取出uint16数组, 与16位数组一样按 0-65535 换算
+HIGH_DEPTH_MODES = ("I;16", "I;16L", "I;16B", "I")
+
+
+def image_array(image):
+    """PIL图像 -> 数组; 16位灰度 (HIGH_DEPTH_MODES) 为uint16"""
+    array = np.asarray(image)
+    if image.mode in HIGH_DEPTH_MODES and array.dtype != np.uint16:
+        array = np.clip(array, 0, 65535).astype(np.uint16)
+    return array
+
+
+def _convert_region(region, mode):
+    """把数组转换到指定的PIL模式 (如法向贴图需要的灰度)"""
+    if mode and region.ndim == 3:
+        region = np.asarray(Image.fromarray(np.ascontiguousarray(region)).convert(mode))
+    return region
+
+
+def make_reader(source, mode):
+    """返回 read(box) 函数, 支持PIL图像与 ndarray / np.memmap"""
+    if isinstance(source, Image.Image):
+        def read(box):
+            region = source.crop(box)
+            if mode and region.mode != mode and region.mode not in HIGH_DEPTH_MODES:
+                region = region.convert(mode)
+            return image_array(region)
+        return read, source.size, len(source.getbands())
+
+    array = np.asarray(source)
+
+    def read(box):
+        left, upper, right, lower = box
+        return _convert_region(array[upper:lower, left:right], mode)
+    channels = array.shape[2] if array.ndim == 3 else 1
+    return read, (array.shape[1], array.shape[0]), channels
+
+
+def choose_tile_size(size, channels, itemsize, operation, max_memory=DEFAULT_MAX_MEMORY):
+    """根据内存上限选择分块边长 (按整行条带分块的操作为条带高度)
+
+    估算值包括带边缘分块的计算开销和一整条分块行的输出缓冲。
+    """
+    width, height = size
+    out_bytes = operation.out_bytes or channels * itemsize
+    work = operation.work_bytes * channels
+    if operation.rows:
+        span = width + 2 * operation.halo
+        rows = (max_memory - 2 * operation.halo * span * work) // (span * work + width * out_bytes)
+        rows = max(MIN_TILE_SIZE, min(rows, height))
+        # 各条带高度均分, 避免最后一条很窄却要计算同样多的边缘行
+        return -(-height // -(-height // rows))
+    tile = MAX_TILE_SIZE
+    while tile > MIN_TILE_SIZE:
+        span = tile + 2 * operation.halo
+        if span * span * work + tile * width * out_bytes <= max_memory:
+            break
+        tile //= 2
+    return max(MIN_TILE_SIZE, min(tile, max(width, height)))
+
+
+class ProcessingCancelled(Exception):
+    """分块处理被取消"""
+
+
+def iter_tiled(source, operation, tile_size=None, max_memory=DEFAULT_MAX_MEMORY,
+               progress=None, cancel=None):
+    """按分块行逐条产出 (起始行, 结果条带)
+
+    按整行条带分块的操作 (operation.rows) 中 tile_size 为条带高度。
+    progress(已完成块数, 总块数) 在每块完成后调用;
+    cancel 为 threading.Event 之类的对象, 置位后在下一块开始前抛出 ProcessingCancelled。
+    """
+    read, size, channels = make_reader(source, operation.mode)
+    width, height = size
+    if tile_size is None:
+        itemsize = read((0, 0, 1, 1)).dtype.itemsize
+        tile_size = choose_tile_size(size, channels, itemsize, operation, max_memory)
+
+    tile_width = width if operation.rows else tile_size
+    total = -(-width // tile_width) * -(-height // tile_size)
+    done = 0
+    for upper in range(0, height, tile_size):
+        lower = min(upper + tile_size, height)
+        band = None
+        for left in range(0, width, tile_width):
+            if cancel is not None and cancel.is_set():
+                raise ProcessingCancelled()
+            right = min(left + tile_width, width)
+            tile = operation.compute(read, size, (left, upper, right, lower))
+            if band is None:
+                band = np.empty((lower - upper, width) + tile.shape[2:], dtype=tile.dtype)
+            band[:, left:right] = tile
+            done += 1
+            if progress is not None:
+                progress(done, total)
+        yield upper, band
+
+
+def run_tiled(source, operation, tile_size=None, max_memory=DEFAULT_MAX_MEMORY,
+              progress=None, cancel=None):
+    """分块计算并拼接为完整数组"""
+    height = source.size[1] if isinstance(source, Image.Image) else source.shape[0]
+    result = None
+    for upper, band in iter_tiled(source, operation, tile_size, max_memory, progress, cancel):
+        if result is None:
+            result = np.empty((height,) + band.shape[1:], dtype=band.dtype)
+        result[upper:upper + band.shape[0]] = band
+    return result
+
+
+class PngStreamWriter:
+    """逐条带写出PNG, 内存中只保留当前条带"""
+
+    COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}  # 通道数 -> PNG颜色类型
+    CHUNK_ROWS = 64
+
+    def __init__(self, path, compress_level=6):
+        self.path = path
+        self.file = None
+        self.compressor = zlib.compressobj(compress_level)
+        self.previous = None
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind + data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def _start(self, width, height, channels, dtype):
+        if dtype not in (np.uint8, np.uint16) or channels not in self.COLOR_TYPES:
+            raise ValueError(f"PNG不支持的数据格式: {dtype} x {channels}")
+        bit_depth = 8 * np.dtype(dtype).itemsize
+        self.file = open(self.path, "wb")
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth,
+                                         self.COLOR_TYPES[channels], 0, 0, 0))
+
+    def write_rows(self, rows, height):
+        """写入若干行像素, height 为整幅图像的高度"""
+        if rows.ndim == 2:
+            rows = rows[:, :, np.newaxis]
+        count, width, channels = rows.shape
+        if self.file is None:
+            self._start(width, height, channels, rows.dtype)
+        raw = rows.astype(rows.dtype.newbyteorder(">"), copy=False)
+        raw = raw.view(np.uint8).reshape(count, -1)
+        bpp = channels * rows.dtype.itemsize
+
+        # 分段滤波压缩, 避免整条带的int16临时数组
+        for start in range(0, count, self.CHUNK_ROWS):
+            chunk = raw[start:start + self.CHUNK_ROWS]
+            data = self.compressor.compress(self._filter(chunk, bpp).tobytes())
+            if data:
+                self._chunk(b"IDAT", data)
+            self.previous = chunk[-1].copy()
+
+    def _filter(self, raw, bpp):
+        """Paeth 滤波: 编码时只依赖原始像素, 可以整段向量化计算"""
+        previous = self.previous if self.previous is not None else np.zeros_like(raw[0])
+        current = raw.astype(np.int16)
+        above = np.empty_like(current)
+        above[0] = previous
+        above[1:] = current[:-1]
+        left = np.zeros_like(current)
+        left[:, bpp:] = current[:, :-bpp]
+        upper_left = np.zeros_like(current)
+        upper_left[:, bpp:] = above[:, :-bpp]
+
+        estimate = left + above - upper_left
+        pa = np.abs(estimate - left)
+        pb = np.abs(estimate - above)
+        pc = np.abs(estimate - upper_left)
+        predictor = np.where((pa <= pb) & (pa <= pc), left,
+                             np.where(pb <= pc, above, upper_left))
+
+        lines = np.empty((raw.shape[0], raw.shape[1] + 1), dtype=np.uint8)
+        lines[:, 0] = 4
+        lines[:, 1:] = (current - predictor) & 0xFF
+        return lines
+
+    def close(self):
+        if self.file is None:
+            return
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+        self.file = None
+
+
+def process_tiled(source, output_path, operation, tile_size=None,
+                  max_memory=DEFAULT_MAX_MEMORY, progress=None, cancel=None, encoder=None):
+    """分块处理并写出结果
+
+    .png 与 .npy / raw 边算边写, 输出不会整幅驻留内存;
+    其它格式的编码器需要完整图像, 会先拼接再交给PIL保存。
+    encoder 为各格式的编码参数 (见 writer.make_encoder)。
+    处理被取消时删除写了一半的输出文件。
+    """
+    height = source.size[1] if isinstance(source, Image.Image) else source.shape[0]
+    bands = iter_tiled(source, operation, tile_size, max_memory, progress, cancel)
+    try:
+        _write_bands(bands, output_path, height, encoder)
+    except ProcessingCancelled:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return True
+
+
+def _write_bands(bands, output_path, height, encoder=None):
+    """按输出格式写出条带"""
+    extension = output_path.lower().rsplit(".", 1)[-1]
+    if extension == "png":
+        params = encoder_params(output_path, encoder)
+        writer = PngStreamWriter(output_path, params.get("compress_level", 6))
+        try:
+            for _, band in bands:
+                writer.write_rows(band, height)
+        finally:
+            writer.close()
+    elif is_array_path(output_path):
+        # .npy / raw 逐条带写入内存映射文件
+        output = None
+        for upper, band in bands:
+            if output is None:
+                output = create_array(output_path, (height,) + band.shape[1:], band.dtype)
+            output[upper:upper + band.shape[0]] = band
+        output.flush()
+        del output
+    else:
+        result = np.concatenate([band for _, band in bands], axis=0)
+        write_array(result, output_path, encoder)
@@ -0,0 +1,133 @@
+"""结果写出 - 按格式设置编码参数, 以及在后台线程中编码、写文件的写出队列
+
+    encoder = make_encoder(png_compress_level=1, jpeg_quality=90)
+    with BackgroundWriter(encoder=encoder) as writer:
+        for path in paths:
+            writer.submit(compute(path), output_path_for(path))
+    # 退出 with 时等待全部写完; 失败的文件见 writer.failures
+
+中间结果可保存为 .tga (不压缩)、.npy (原样保存数组, 保留 uint16/float 等数据类型)
+或 raw (只限与扩展名相符的单通道数据, 见 arrayio.check_raw_output)。
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+import instrument
+from arrayio import check_raw_output
+
+# 扩展名 -> 编码参数所用的格式名
+FORMAT_NAMES = {"jpg": "jpeg", "jpeg": "jpeg", "png": "png", "tga": "tga", "npy": "npy",
+                "raw": "raw", "r8": "raw", "r16": "raw", "r32": "raw"}
+
+DEFAULT_MAX_PENDING = 4
+
+
+def make_encoder(png_compress_level=None, jpeg_quality=None, tga_rle=None):
+    """按格式整理编码参数: {格式名: PIL保存参数}, 未指定的项使用PIL默认值"""
+    encoder = {}
+    if png_compress_level is not None:
+        encoder["png"] = {"compress_level": png_compress_level}
+    if jpeg_quality is not None:
+        encoder["jpeg"] = {"quality": jpeg_quality}
+    if tga_rle is not None:
+        encoder["tga"] = {"rle": tga_rle}
+    return encoder
+
+
+def output_format(output_path):
+    extension = os.path.splitext(output_path)[1].lower().lstrip(".")
+    return FORMAT_NAMES.get(extension, extension)
+
+
+def encoder_params(output_path, encoder=None):
+    """该输出文件的PIL保存参数"""
+    return dict((encoder or {}).get(output_format(output_path), {}))
+
+
+def write_array(array, output_path, encoder=None):
+    """把结果数组写为文件: .npy 与 raw 原样保存, 其它格式由PIL按 encoder 的参数编码"""
+    if output_format(output_path) in ("npy", "raw"):
+        with instrument.span("encode", path=output_path) as args:
+            if output_format(output_path) == "npy":
+                np.save(output_path, array)
+            else:
+                check_raw_output(output_path, array.shape, array.dtype)
+                np.ascontiguousarray(array).tofile(output_path)
+            if instrument.enabled():
+                args["bytes_written"] = os.path.getsize(output_path)
+        return
+    instrument.save_image(Image.fromarray(array), output_path, **encoder_params(output_path, encoder))
+
+
+class BackgroundWriter:
+    """后台写出队列: 编码和写文件在线程池中进行, 与下一次计算重叠
+
+    最多 max_pending 个写出尚未完成, 再提交时阻塞等待, 限制排队结果占用的内存。
+    写出失败时删除不完整的文件, 并记录在 failures [(输出路径, 异常), ...] 中。
+    """
+
+    def __init__(self, workers=1, max_pending=DEFAULT_MAX_PENDING, encoder=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="writer")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.encoder = encoder
+        self.lock = threading.Lock()
+        self.pending = []
+        self.failures = []
+
+    def submit(self, array, output_path, encoder=None, callback=None):
+        """提交一个写出任务, 返回 Future; 写完后在写出线程中调用 callback()
+
+        提交后不应再修改 array。
+        """
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self._write, array, output_path,
+                                          self.encoder if encoder is None else encoder, callback)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending = [item for item in self.pending if not item.done()]
+            self.pending.append(future)
+        return future
+
+    def _write(self, array, output_path, encoder, callback):
+        try:
+            write_array(array, output_path, encoder)
+            if callback is not None:
+                callback()
+        except Exception as error:
+            if os.path.exists(output_path):
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+            with self.lock:
+                self.failures.append((output_path, error))
+            raise
+        finally:
+            self.slots.release()
+
+    def flush(self):
+        """等待已提交的写出全部完成, 返回到目前为止的失败列表"""
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending)
+        return list(self.failures)
+
+    def close(self):
+        """写完所有结果并结束写出线程, 返回失败列表"""
+        failures = self.flush()
+        self.executor.shutdown(wait=True)
+        return failures
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False